@@ -0,0 +1,105 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file measures the number of connections opened per downloaded
+segment with and without a pooled session.  
+
+Starts a local HTTP server with fake segments, downloads them with
+module-level `requests.get` (one connection per request) and with
+`fetch_segments` over a session from `create_session`.  
+
+Usage: python -m benchmark.connections [segments]
+"""
+
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+import requests
+
+from data.api import create_session
+from data.download_functions import fetch_segments
+
+# Fake segment size in bytes.
+SEGMENT_BYTES = 256 * 1024
+
+
+class SegmentHandler(BaseHTTPRequestHandler):
+    """Serves fake segments and counts opened connections."""
+    protocol_version = "HTTP/1.1"
+
+    connections = 0
+    lock = Lock()
+
+    def setup(self):
+        super().setup()
+        with SegmentHandler.lock:
+            SegmentHandler.connections += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp2t")
+        self.send_header("Content-Length", str(SEGMENT_BYTES))
+        self.end_headers()
+        self.wfile.write(b'\0' * SEGMENT_BYTES)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(name, download, links):
+    """Runs `download` for `links`, prints connections per segment."""
+    SegmentHandler.connections = 0
+    start = time.perf_counter()
+    count = sum(segment is not None for segment in download(links))
+    elapsed = time.perf_counter() - start
+
+    print(f"{name}: {count} segment(s) in {elapsed:.2f} s, "
+          f"{SegmentHandler.connections} connection(s), "
+          f"{SegmentHandler.connections / count:.2f} connection(s)/segment.")
+
+
+def main(segments=200):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SegmentHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    host, port = server.server_address
+    links = [f"http://{host}:{port}/segment/{i}.ts" for i in range(segments)]
+
+    # Before: a new connection for every request.
+    run("requests.get", lambda links: (requests.get(link).content
+                                       for link in links), links)
+
+    # After: parallel downloads over a pooled session.
+    http_session = create_session()
+    run("pooled session", lambda links: fetch_segments(http_session, links),
+        links)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
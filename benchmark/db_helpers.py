@@ -0,0 +1,140 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file benchmarks `data/db_functions.py` helpers on generated
+databases of different sizes.  
+
+Every size drops and recreates the tables in the database at `url`, so
+use a scratch database. Each helper runs in its own transaction that is
+rolled back, reported time is the median of `REPEAT` runs.  
+
+Usage: python -m benchmark.db_helpers url [frames ...]  
+Default sizes: 10k, 1M and 10M frames.
+"""
+
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy.orm import sessionmaker
+
+import config
+
+# Don't connect to the configured database on import. Must be set before
+# `data` imports.
+config.DB_BACKEND = "sqlite"
+config.SQLITE_PATH = str(Path(tempfile.mkdtemp(prefix="twitch_category_"),
+                              "scratch.db"))
+
+from data.db import Base, Game, Frame, make_engine
+from data.db_functions import (update_games, get_game_count, get_frame_count,
+                               update_frame_count, touched_games,
+                               min_data_category, max_data_category,
+                               add_frame, game_ids_to_names)
+
+GAMES = 40
+REPEAT = 5
+INSERT_BATCH = 50000
+
+
+def populate(engine, frames):
+    """Recreates the tables with `GAMES` games and `frames` frames."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    engine.execute(Game.__table__.insert(),
+                   [{'id': id, 'name': f"Game {id}", 'frames': 0}
+                    for id in range(1, GAMES + 1)])
+
+    # Frames are spread over the last 30 days.
+    now = datetime.utcnow()
+    for start in range(0, frames, INSERT_BATCH):
+        rows = []
+        for i in range(start, min(start + INSERT_BATCH, frames)):
+            game_id = i % GAMES + 1
+            rows.append({'path': f"{game_id}/{i}.jpg",
+                         'game_id': game_id,
+                         'user_login': f"stream_{i % 1000}",
+                         'date': now - timedelta(seconds=i % 2592000)})
+        engine.execute(Frame.__table__.insert(), rows)
+
+
+def bench(Session, function):
+    """Returns the median time of `function(session)` in milliseconds."""
+    times = []
+    for _ in range(REPEAT):
+        session = Session()
+        start = time.perf_counter()
+        function(session)
+        times.append((time.perf_counter() - start) * 1000)
+        session.rollback()
+        session.close()
+
+    return statistics.median(times)
+
+
+def main(url, *sizes):
+    engine = make_engine(url)
+    Session = sessionmaker(bind=engine)
+
+    since = datetime.utcnow() - timedelta(hours=1)
+    new_games = {str(id): f"Game {id}" for id in range(1, GAMES + 11)}
+    helpers = {
+        'get_game_count': get_game_count,
+        'get_frame_count': get_frame_count,
+        'update_games': lambda session: update_games(session, new_games),
+        'update_frame_count': update_frame_count,
+        'update_frame_count (1 game)':
+            lambda session: update_frame_count(session, {1}),
+        'touched_games (1 hour)':
+            lambda session: touched_games(session, since),
+        'min_data_category': min_data_category,
+        'max_data_category': max_data_category,
+        'add_frame':
+            lambda session: add_frame(session, "1/0.jpg", 1, "stream"),
+        'game_ids_to_names':
+            lambda session: game_ids_to_names(session, range(1, GAMES + 1)),
+    }
+
+    for frames in map(int, sizes or (10000, 1000000, 10000000)):
+        print(f"Populating {frames} frame(s).")
+        start = time.perf_counter()
+        populate(engine, frames)
+        print(f"Populated in {time.perf_counter() - start:.1f} s.")
+
+        for name, function in helpers.items():
+            print(f"{frames:>10} {name:<30} "
+                  f"{bench(Session, function):10.2f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit()
+
+    main(*sys.argv[1:])
@@ -0,0 +1,173 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file benchmarks the harvester against the local stand-in server
+(`benchmark/standin.py`), so changes can be measured without twitch.  
+
+Modes:  
+    frames - runs `download_frames` for a number of streams, no database.  
+    update - runs `download.update_data` for a number of seconds.  
+
+Frames and an SQLite database are saved to a temporary download folder.
+Reports frames/sec, bytes/frame and p50/p99 segment latency.  
+
+Usage: python -m benchmark.harvest frames|update [streams|seconds]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+from threading import Lock
+from types import SimpleNamespace
+
+import config
+
+# Save frames and the database to a temporary folder. Must be set before
+# `data` imports.
+config.DOWNLOAD_PATH = tempfile.mkdtemp(prefix="twitch_category_")
+config.DB_BACKEND = "sqlite"
+config.SQLITE_PATH = str(Path(config.DOWNLOAD_PATH, "twitch_category.db"))
+
+import requests
+
+import data.api
+from data.api import create_session
+from data.download_functions import download_frames
+
+from benchmark.standin import StandIn
+from benchmark.stats import percentile
+
+
+class TimingSession(requests.Session):
+    """Session that records latency and size of segment responses."""
+
+    def __init__(self, session):
+        super().__init__()
+        self.adapters = session.adapters
+        self.lock = Lock()
+        self.latencies = []
+        self.segment_bytes = 0
+
+    def request(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().request(method, url, *args, **kwargs)
+
+        if url.endswith('.ts'):
+            with self.lock:
+                self.latencies.append(time.perf_counter() - start)
+                self.segment_bytes += len(response.content)
+
+        return response
+
+
+class StandInStreamlink:
+    """Streamlink stand-in that returns stand-in playlist urls."""
+    base_url = None
+
+    def streams(self, url):
+        login = url.rstrip('/').rsplit('/', 1)[1]
+        url = f"{self.base_url}/hls/{login}.m3u8"
+        return {'best': SimpleNamespace(url=url)}
+
+
+def report(frames, elapsed, session, standin):
+    """Prints benchmark results."""
+    latencies = session.latencies
+    print(f"Frames: {frames} in {elapsed:.1f} s, "
+          f"{frames / elapsed:.2f} frame(s)/sec.")
+    print(f"Segments: {len(latencies)}, "
+          f"{session.segment_bytes / max(frames, 1) / 1024:.0f} KB/frame.")
+    print(f"Segment latency: p50 {percentile(latencies, 50) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.0f} ms.")
+    print("Served:", ", ".join(f"{kind}: {count}" for kind, count
+                               in sorted(standin.requests.items())))
+
+
+def bench_frames(standin, session, streams=20):
+    """Runs `download_frames` for `streams` streams."""
+    streamlink_session = StandInStreamlink()
+    frames = 0
+    start = time.perf_counter()
+    for i in range(streams):
+        game_id = i % standin.games + 1
+        for _ in download_frames(streamlink_session, f"stream_{game_id}_{i}",
+                                 game_id, session):
+            frames += 1
+
+    return frames, time.perf_counter() - start
+
+
+def bench_update(standin, session, seconds=60):
+    """Runs `update_data` for `seconds` seconds."""
+    # Import here, the database is not needed for other modes.
+    import data.download
+
+    frames = []
+
+    def input_thread(input_list):
+        time.sleep(seconds)
+        input_list.append(True)
+
+    def counting_download_frames(*args, **kwargs):
+        for frame_path in download_frames(*args, **kwargs):
+            frames.append(frame_path)
+            yield frame_path
+
+    data.download.input_thread = input_thread
+    data.download.download_frames = counting_download_frames
+    data.download.create_session = lambda: session
+    data.download.Streamlink = StandInStreamlink
+
+    start = time.perf_counter()
+    data.download.update_data()
+
+    return len(frames), time.perf_counter() - start
+
+
+def main(mode="frames", *args):
+    standin = StandIn()
+    base_url = standin.start()
+
+    # Point the api and streamlink at the stand-in.
+    data.api.BASE_URL = f"{base_url}/helix/"
+    StandInStreamlink.base_url = base_url
+
+    session = TimingSession(create_session())
+    if mode == "frames":
+        frames, elapsed = bench_frames(standin, session, *map(int, args))
+    elif mode == "update":
+        frames, elapsed = bench_update(standin, session, *map(int, args))
+    else:
+        print(__doc__)
+        return
+
+    standin.stop()
+    report(frames, elapsed, session, standin)
+    print(f"Frames saved in {config.DOWNLOAD_PATH}.")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
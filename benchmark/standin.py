@@ -0,0 +1,238 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file runs a local stand-in for the twitch api and stream servers.  
+
+Serves fake helix `games/top`, `streams` and `games` endpoints under
+`/helix/` and HLS playlists with synthetic `.ts` segments under `/hls/`.
+Latency, ad segments and rate limited (429) responses are configurable.  
+
+Segments are generated with ffmpeg if it is available, otherwise they are
+random bytes (downloaded, but not decodable).  
+
+Usage: python -m benchmark.standin [port]
+"""
+
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import urlparse, parse_qs
+
+from config import FFMPEG_PATH
+
+
+class StandIn:
+    """
+    Stand-in server settings and state.  
+
+    `games` - number of categories, `streams` - number of streams in every
+    category, `segments` - number of segments in a playlist,
+    `latency` - response delay in seconds, `ad_rate` - fraction of ad
+    segments, `rate_limit_rate` - fraction of api requests answered with 429.
+    """
+
+    def __init__(self, games=40, streams=150, segments=6, latency=0.05,
+                 ad_rate=0.1, rate_limit_rate=0.02, segment_count=16):
+        self.games = games
+        self.streams = streams
+        self.segments = segments
+        self.latency = latency
+        self.ad_rate = ad_rate
+        self.rate_limit_rate = rate_limit_rate
+
+        self.segment_data = make_segments(segment_count)
+
+        # Served requests and bytes by request type.
+        self.lock = Lock()
+        self.requests = dict()
+        self.bytes = dict()
+
+        self.server = None
+
+    def start(self, port=0):
+        """Starts the server in a thread. Returns the base url."""
+        handler = type('Handler', (StandInHandler, ), {'standin': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        """Stops the server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, kind, size):
+        """Counts a served request of `kind` with `size` bytes."""
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.bytes[kind] = self.bytes.get(kind, 0) + size
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Request handler. `standin` is set by `StandIn.start`."""
+    protocol_version = "HTTP/1.1"
+    standin = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+
+        time.sleep(self.standin.latency)
+
+        if parts[0] == 'helix':
+            self.helix('/'.join(parts[1:]), params)
+        elif parts[0] == 'hls' and len(parts) == 2:
+            self.playlist(parts[1].rsplit('.', 1)[0])
+        elif parts[0] == 'hls' and len(parts) == 3:
+            self.segment(int(parts[2].split('.')[0]))
+        else:
+            self.send('text/plain', b'Not found.', 404)
+
+    def helix(self, query, params):
+        """Serves api endpoints."""
+        standin = self.standin
+        headers = {'Ratelimit-Limit': '800',
+                   'Ratelimit-Remaining': '799',
+                   'Ratelimit-Reset': str(int(time.time()) + 1)}
+
+        if random.random() < standin.rate_limit_rate:
+            headers['Ratelimit-Remaining'] = '0'
+            self.send('application/json', b'{"status": 429}', 429, headers)
+            standin.count('helix 429', 0)
+            return
+
+        first = int(params.get('first', ['20'])[0])
+        after = int(params.get('after', ['0'])[0])
+
+        if query == 'games/top':
+            items = [{'id': str(game_id), 'name': f"Game {game_id}"}
+                     for game_id in range(1, standin.games + 1)]
+        elif query == 'streams':
+            game_id = params.get('game_id', ['0'])[0]
+            items = [{'user_login': f"stream_{game_id}_{i}"}
+                     for i in range(standin.streams)]
+        elif query == 'games':
+            items = [{'id': game_id, 'name': f"Game {game_id}"}
+                     for game_id in params.get('id', [])]
+            first = len(items)
+        else:
+            self.send('text/plain', b'Not found.', 404)
+            return
+
+        page = items[after:after + first]
+        quote = {'data': page, 'pagination': {}}
+        if after + first < len(items):
+            quote['pagination']['cursor'] = str(after + first)
+
+        body = json.dumps(quote).encode()
+        self.send('application/json', body, 200, headers)
+        standin.count('helix', len(body))
+
+    def playlist(self, login):
+        """Serves a media playlist, some segments are ads."""
+        standin = self.standin
+        sequence = random.randrange(1000000)
+        date = datetime.now(timezone.utc) - timedelta(seconds=60)
+
+        lines = ["#EXTM3U",
+                 "#EXT-X-VERSION:3",
+                 "#EXT-X-TARGETDURATION:2",
+                 f"#EXT-X-MEDIA-SEQUENCE:{sequence}"]
+        for i in range(standin.segments):
+            ad = random.random() < standin.ad_rate
+            segment_date = date + timedelta(seconds=2 * i)
+            lines.append("#EXT-X-PROGRAM-DATE-TIME:"
+                         + segment_date.strftime('%Y-%m-%dT%H:%M:%S.000Z'))
+            lines.append("#EXTINF:2.000," + ("Amazon|1" if ad else "live"))
+            lines.append(f"http://{self.headers['Host']}/hls/{login}/"
+                         f"{sequence + i}.ts")
+
+        body = ('\n'.join(lines) + '\n').encode()
+        self.send('application/vnd.apple.mpegurl', body)
+        standin.count('playlist', len(body))
+
+    def segment(self, number):
+        """Serves a synthetic segment."""
+        segment_data = self.standin.segment_data
+        body = segment_data[number % len(segment_data)]
+        self.send('video/mp2t', body)
+        self.standin.count('segment', len(body))
+
+    def send(self, content_type, body, status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_segments(count):
+    """
+    Returns a list of `count` synthetic 2 second `.ts` segments with
+    different images.
+    """
+    if not shutil.which(FFMPEG_PATH):
+        print("ffmpeg not found, segments are random bytes.")
+        return [os.urandom(512 * 1024) for _ in range(count)]
+
+    segments = []
+    for seed in range(count):
+        command = [FFMPEG_PATH, '-loglevel', 'quiet',
+                   '-f', 'lavfi',
+                   '-i', f"life=size=320x180:rate=30:seed={seed}:ratio=0.3",
+                   '-t', '2',
+                   '-vf', 'scale=1280:720:flags=neighbor',
+                   '-pix_fmt', 'yuv420p',
+                   '-c:v', 'libx264', '-preset', 'ultrafast',
+                   '-b:v', '6M', '-maxrate', '6M', '-bufsize', '6M',
+                   '-f', 'mpegts', 'pipe:1']
+        segments.append(subprocess.run(command, stdout=subprocess.PIPE,
+                                       check=True).stdout)
+
+    return segments
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    standin = StandIn()
+    print(f"Stand-in server at {standin.start(port)}. Press Enter to stop.")
+    input()
+    standin.stop()
@@ -2,16 +2,115 @@
 CLIENT_ID = ""
 ACCESS_TOKEN = ""
 
+# API rate limit (points per minute), number of retries of failed requests
+# and the first retry delay in seconds (doubles with every retry).
+HELIX_RATE_LIMIT = 800
+HELIX_RETRIES = 5
+HELIX_BACKOFF = 1
+
+# API cache: time to live in seconds for every endpoint (`None` - forever),
+# maximum number of responses cached in memory and a path to the on-disk
+# cache file ("" - memory only).
+CACHE_TTL = {"games/top": 600, "streams": 60, "games": None}
+CACHE_SIZE = 1024
+CACHE_PATH = ""
+
+# Number of top categories checked (100 max), minimum number of streams
+# for a category to be added and the number of parallel api requests.
+TOP_GAMES = 100
+MIN_STREAMS = 90
+API_WORKERS = 16
+
 # Database settings.
+# Backend: "postgres" or "sqlite" (embedded database at `SQLITE_PATH`, no
+# server needed).
+DB_BACKEND = "postgres"
+SQLITE_PATH = "twitch_category.db"
+
+# Postgres settings.
 DB_NAME = ""
 DB_HOST = "localhost"
 DB_PORT = "5432"
 DB_USER = ""
 DB_PASSWORD = ""
 
+# Frames are added to the database in batches of `FLUSH_FRAMES` frames or
+# every `FLUSH_SECONDS` seconds.
+FLUSH_FRAMES = 100
+FLUSH_SECONDS = 10
+
+# Frames are written by a background thread, workers wait when more than
+# `WRITE_QUEUE_SIZE` frames are waiting to be written. Failed writes are
+# retried after `WRITE_RETRY_DELAY` seconds, the delay doubles with every
+# retry up to `WRITE_RETRY_MAX` seconds.
+WRITE_QUEUE_SIZE = 10000
+WRITE_RETRY_DELAY = 1
+WRITE_RETRY_MAX = 60
+
+# Database sync: number of frame paths loaded per insert and the number
+# of scanned frames between progress messages.
+SYNC_BATCH = 10000
+SYNC_PROGRESS = 100000
+
+# Harvester category frame counts are reloaded from the database every
+# `SCHEDULER_SYNC` seconds.
+SCHEDULER_SYNC = 300
+
 # Data download path.
 DOWNLOAD_PATH = ""
 
+# Frames storage format: "files" saves every frame as `frames/game_id/n.jpg`,
+# "shards" appends frames to `shards/game_id/n.tar` files of about
+# `SHARD_SIZE` bytes.
+STORAGE_FORMAT = "files"
+SHARD_SIZE = 256 * 1024 * 1024
+
+# Frames manifest file in the download folder exported by `data.manifest`
+# (".parquet" or ".arrow"). `model.create` walks the data folders without
+# it.
+MANIFEST_FILE = "manifest.parquet"
+
+# Harvester metrics are served at `http://localhost:METRICS_PORT/metrics`
+# in the Prometheus text format, e.g. `METRICS_PORT = 9464`. `None`
+# disables the endpoint.
+METRICS_PORT = None
+
+# Write timings of download stages (spans) to this JSON lines file in the
+# download folder, "" disables tracing. Report: `python -m data.trace`.
+TRACE_FILE = ""
+
+# Errors are logged as JSON lines to `LOG_FILE` by a background thread.
+# Segments that failed to be processed are kept in the `debug` folder,
+# at most `DEBUG_SEGMENTS_SIZE` bytes (the oldest are deleted) and
+# `DEBUG_SEGMENTS_RATE` segments per minute.
+LOG_FILE = "data/log.jsonl"
+DEBUG_SEGMENTS_SIZE = 256 * 1024 * 1024
+DEBUG_SEGMENTS_RATE = 10
+
+# Number of streams harvested in parallel.
+HARVEST_WORKERS = 4
+
+# Number of stream segments downloaded in parallel.
+SEGMENT_WORKERS = 4
+
+# HTTP connection pools: number of hosts and connections per host.
+HTTP_POOL_CONNECTIONS = 32
+HTTP_POOL_SIZE = HARVEST_WORKERS * SEGMENT_WORKERS
+
+# HTTP request timeouts in seconds: (connect, read).
+HTTP_TIMEOUT = (5, 30)
+
+# Decode segments in memory by piping them to ffmpeg instead of saving
+# them to `temp` folder. Falls back to files if ffmpeg is not found.
+DECODE_IN_MEMORY = True
+FFMPEG_PATH = "ffmpeg"
+DECODE_TIMEOUT = 10
+
+# Skip frames whose perceptual hash differs from a hash of a saved frame in
+# the same category by at most this number of bits (of 64).
+# `None` disables deduplication.
+DEDUP_DISTANCE = 4
+
 # Image size.
 IMG_SIZE = {"height": 240, "width": 240}
 
@@ -25,16 +25,36 @@ SOFTWARE.
 """
 This file has functions that get data from twitch api.  
 
-Functions:  
-    1) Request helper function.  
-    2) Get top games by amount of viewers.  
-    3) Get user logins that broadcast a specified game ID.  
-    4) Get game name from game ID.
+Top games, streams and game names are cached in `api_cache` for
+`CACHE_TTL` seconds.  
+
+Functions and classes:  
+    1) Rate limiter shared by all api requests.  
+    2) Create a session with a connection pool.  
+    3) Request helper function.  
+    4) Paginated request helper function.  
+    5) Get top games by amount of viewers.  
+    6) Get user logins that broadcast a specified game ID.  
+    7) Get game names for many game IDs with batched requests.  
+    8) Get game names from the local database.
 """
 
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
 import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy.exc import SQLAlchemyError
+
+from data.cache import TTLCache, Uncached, cached
+from data.metrics import counter, histogram
 
-from config import CLIENT_ID, ACCESS_TOKEN
+from config import (CLIENT_ID, ACCESS_TOKEN,
+                    HTTP_POOL_CONNECTIONS, HTTP_POOL_SIZE, HTTP_TIMEOUT,
+                    HELIX_RATE_LIMIT, HELIX_RETRIES, HELIX_BACKOFF,
+                    CACHE_TTL, CACHE_SIZE, CACHE_PATH,
+                    TOP_GAMES, MIN_STREAMS, API_WORKERS)
 
 BASE_URL = 'https://api.twitch.tv/helix/'
 HEADERS = {
@@ -42,23 +62,173 @@ HEADERS = {
     'Client-Id': CLIENT_ID
 }
 
+# Api request metrics.
+api_seconds = histogram('api_request_seconds',
+                        "Api request latency in seconds.", ['endpoint'])
+api_responses = counter('api_responses_total',
+                        "Api responses by status code, `error` for "
+                        "connection errors.", ['endpoint', 'status'])
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket for api requests.  
+
+    Holds up to `capacity` tokens refilled at `capacity` per `period`
+    seconds. Follows `Ratelimit-Remaining` and `Ratelimit-Reset` response
+    headers, so the bucket never has more tokens than the api allows and
+    requests wait for the reset when no points are left.
+    """
+
+    def __init__(self, capacity, period=60):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+        # Monotonic time until which requests wait for the api reset.
+        self.blocked_until = 0
+
+        self.lock = Lock()
+
+    def acquire(self):
+        """Blocks until a request can be made and takes a token."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                refill = (now - self.updated) * self.rate
+                self.tokens = min(self.capacity, self.tokens + refill)
+                self.updated = now
+
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = max(self.blocked_until - now,
+                           (1 - self.tokens) / self.rate)
+
+            time.sleep(wait)
+
+    def update(self, response):
+        """Updates the bucket with response rate limit headers."""
+        try:
+            remaining = int(response.headers['Ratelimit-Remaining'])
+            reset = int(response.headers['Ratelimit-Reset'])
+        except (KeyError, ValueError):
+            return
+
+        with self.lock:
+            self.tokens = min(self.tokens, remaining)
+
+            # Wait for the reset if no points are left.
+            if remaining < 1 or response.status_code == 429:
+                self.tokens = 0
+                self.blocked_until = max(
+                    self.blocked_until,
+                    time.monotonic() + max(reset - time.time(), 0)
+                )
+
+
+# Rate limiter shared by all sessions and threads.
+rate_limiter = RateLimiter(HELIX_RATE_LIMIT)
+
+# Cache of parsed api responses.
+api_cache = TTLCache(CACHE_SIZE, CACHE_PATH)
+
+
+def create_session(pool_connections=HTTP_POOL_CONNECTIONS,
+                   pool_size=HTTP_POOL_SIZE):
+    """
+    Returns a session that keeps connections alive and reuses them.  
+
+    `pool_connections` is the number of hosts to keep pools for,
+    `pool_size` is the number of connections kept for every host.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
 def request_query(session, query, payload):
-    """Makes a request and returns a response."""
-    try:
-        response = session.get(BASE_URL + query,
-                               params=payload,
-                               headers=HEADERS)
-        response.raise_for_status()
+    """
+    Makes a request and returns a response.  
 
-        return response
+    Waits for `rate_limiter` before every attempt, retries rate limited
+    (429) requests, server and connection errors `HELIX_RETRIES` times
+    with exponential backoff.  
+    Returns `None` if the request fails.
+    """
+    for attempt in range(HELIX_RETRIES + 1):
 
-    except requests.RequestException:
-        return None
+        # Wait in the queue.
+        rate_limiter.acquire()
+
+        start = time.perf_counter()
+        try:
+            response = session.get(BASE_URL + query,
+                                   params=payload,
+                                   headers=HEADERS,
+                                   timeout=HTTP_TIMEOUT)
+            rate_limiter.update(response)
+            api_seconds.observe(time.perf_counter() - start, endpoint=query)
+            api_responses.inc(endpoint=query, status=response.status_code)
+
+            # Retry rate limited requests and server errors.
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                return response
+
+        except requests.HTTPError:
+            return None
+
+        except requests.RequestException:
+            api_responses.inc(endpoint=query, status='error')
+
+        if attempt < HELIX_RETRIES:
+            time.sleep(HELIX_BACKOFF * 2 ** attempt)
+
+    return None
+
+def request_pages(session, query, payload, limit):
+    """
+    Makes requests following pagination cursors until `limit` items are
+    received or there are no more pages.  
+
+    Returns a list of `data` items or `None` if a request fails.
+    Raises `KeyError`, `TypeError`, `ValueError` if can't parse a response.
+    """
+    payload = dict(payload, first=min(limit, 100))
+    items = []
+    while len(items) < limit:
 
+        response = request_query(session, query, payload)
+        if not response:
+            return None
+
+        quote = response.json()
+        items += quote['data']
+
+        # Get the next page cursor.
+        cursor = quote.get('pagination', {}).get('cursor')
+        if not cursor or not quote['data']:
+            break
+        payload['after'] = cursor
+
+    return items[:limit]
+
+
+@cached(api_cache, 'games/top', CACHE_TTL['games/top'])
 def get_top_games(session):
     """
     Returns top games dictionary of format:
-    {game_id: game_name}
+    {game_id: game_name}  
+
+    Checks `TOP_GAMES` top categories, streamer counts of categories are
+    requested in parallel.
     """
     # Ignore these categories:
     not_video_games = {
@@ -78,63 +248,72 @@ def get_top_games(session):
         "498566": "Slots"
     }
     
-    # Number of categories to return (100 max).
-    first = 25
-
     # Make a query.
     query = f'games/top'
-    payload = {'first': first}
+    payload = dict()
 
-    # Make a request.
-    response = request_query(session, query, payload)
-    if not response:
-        print("getTopGames error. No response from API.")
-        return None
-
-    # Parse the response.
+    # Make requests and parse the responses.
     try:
-        quote = response.json()
-        games = dict()
-        for game in quote['data']:
-            
-            id = game['id']
-            name = game['name']
+        top_games = request_pages(session, query, payload, TOP_GAMES)
+        if top_games is None:
+            print("getTopGames error. No response from API.")
+            return None
 
-            # Ensure it's a video game.
-            if id in not_video_games:
-                continue
-
-            # Ensure the game is streamed by more than 90 streamers.
-            if len(get_streams(session, id)) > 90:
-                games[id] = name
-
-        return games
+        # Ensure they are video games.
+        candidates = {game['id']: game['name'] for game in top_games
+                      if game['id'] not in not_video_games}
 
     except (KeyError, TypeError, ValueError):
         print("getTopGames error. Can't parse the response.")
         return None
 
+    # Ensure the games are streamed by more than `MIN_STREAMS` streamers.
+    # Request only enough streams to check it.
+    # `None` if the streams lookup failed.
+    def is_popular(id):
+        streams = get_streams(session, id, MIN_STREAMS + 1)
+        if streams is None:
+            return None
+        return len(streams) > MIN_STREAMS
+
+    with ThreadPoolExecutor(max_workers=API_WORKERS) as executor:
+        popular = list(executor.map(is_popular, candidates))
+
+    games = {id: candidates[id]
+             for id, qualified in zip(candidates, popular) if qualified}
+
+    # Don't cache an empty or incomplete result (some categories could
+    # not be checked), so the next call asks the api again.
+    failed = popular.count(None)
+    if failed:
+        print(f"getTopGames error. Could not check {failed} categories.")
+    if not games or failed:
+        return Uncached(games)
+
+    return games
 
-def get_streams(session, game_id):
-    """Returns a set of user logins that broadcast a specified game ID."""
-    # Number of logins to return (100 max).
-    first = 100
 
+@cached(api_cache, 'streams', CACHE_TTL['streams'])
+def get_streams(session, game_id, limit=100):
+    """
+    Returns a set of user logins that broadcast a specified game ID.  
+
+    Follows pagination cursors until `limit` logins are received.
+    """
     # Make a query.
     query = f"streams"
-    payload = {'game_id': game_id, 'first': first}
+    payload = {'game_id': game_id}
 
-    # Make a request.
-    response = request_query(session, query, payload)
-    if not response:
-        print(f"getStreams error. No response from API. Game ID: {game_id}")
-        return None
-    
-    # Parse the response.
+    # Make requests and parse the responses.
     try:
-        quote = response.json()
+        data = request_pages(session, query, payload, limit)
+        if data is None:
+            print("getStreams error. No response from API. "
+                 f"Game ID: {game_id}")
+            return None
+
         streams = set()
-        for stream in quote['data']:
+        for stream in data:
             streams.add(stream['user_login'])
 
         return streams
@@ -145,26 +324,62 @@ def get_streams(session, game_id):
         return None
     
 
-def game_id_to_name(session, game_id):
-    """Converts game ID to name using the API."""
-    # Make a query.
-    query = f"games"
-    payload = {'id': game_id}
+def game_ids_to_names(session, game_ids):
+    """
+    Returns a dictionary of format {game_id: game_name} for an iterable of
+    game IDs. Game IDs are strings, games that are not found are skipped.  
 
-    # Make a request.
-    response = request_query(session, query, payload)
-    if not response:
-        print(f"gameIDtoName error. No response from API. Game ID: {game_id}")
-        return None
+    Names are taken from the local `games` table and `api_cache` first,
+    the rest is requested by 100 IDs per request.
+    """
+    game_ids = {str(game_id) for game_id in game_ids}
+
+    # Get names from the database.
+    names = local_game_names(game_ids)
+
+    # Get names from the cache.
+    for game_id in game_ids - set(names):
+        found, name = api_cache.get(f"games:{game_id}")
+        if found:
+            names[game_id] = name
+
+    # Request the rest.
+    missing = sorted(game_ids - set(names))
+    for i in range(0, len(missing), 100):
+        query = f"games"
+        payload = [('id', game_id) for game_id in missing[i:i + 100]]
+
+        response = request_query(session, query, payload)
+        if not response:
+            print("gameIDsToNames error. No response from API.")
+            continue
+
+        try:
+            for game in response.json()['data']:
+                names[game['id']] = game['name']
+                api_cache.set(f"games:{game['id']}", game['name'],
+                              CACHE_TTL['games'])
 
-    # Parse the response.
+        except (KeyError, TypeError, ValueError):
+            print("gameIDsToNames error. Can't parse the response.")
+
+    return names
+
+
+def local_game_names(game_ids):
+    """
+    Returns a dictionary of format {game_id: game_name} for games from
+    `game_ids` that are in the local `games` table.  
+
+    Returns an empty dictionary if the database is not available
+    (e.g. for recognition without the data module set up), that's why
+    the database is imported here.
+    """
     try:
-        quote = response.json()
-        game = quote['data'][0]['name']
+        from data.db_functions import session_scope, game_ids_to_names
 
-        return game
+        with session_scope() as db_session:
+            return game_ids_to_names(db_session, game_ids)
 
-    except (KeyError, TypeError, ValueError):
-        print("gameIDtoName error. Can't parse the response. "
-             f"Game ID: {game_id}")
-        return None
+    except (SQLAlchemyError, ImportError):
+        return dict()
@@ -0,0 +1,157 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file has a cache for api responses.  
+
+Functions and classes:  
+    1) LRU cache with per-entry time to live and an optional on-disk store.  
+    2) Wrapper of results that must not be cached.  
+    3) Decorator that caches results of api functions.
+"""
+
+import atexit
+import copy
+import shelve
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a time to live for every entry.  
+
+    Keeps up to `maxsize` entries in memory. If `path` is passed, entries
+    are also saved in a `shelve` file at `path`, so they survive restarts.
+    Counts cache hits and misses.
+    """
+
+    def __init__(self, maxsize, path=None):
+        self.maxsize = maxsize
+        self.lock = Lock()
+
+        # {key: (expiration time or `None`, value)}
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        self.store = shelve.open(str(path)) if path else None
+        if self.store is not None:
+            atexit.register(self.close)
+
+    def get(self, key):
+        """
+        Returns tuple (`found`, `value`).  
+        `found` is `False` if the key is not cached or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.store is not None:
+                entry = self.store.get(key)
+
+            if (entry is None
+                    or entry[0] is not None and entry[0] < time.time()):
+                self.misses += 1
+                return False, None
+
+            # Mark as recently used.
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.evict()
+
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Caches `value` for `ttl` seconds (forever if `ttl` is `None`)."""
+        entry = (time.time() + ttl if ttl is not None else None, value)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.evict()
+
+            if self.store is not None:
+                self.store[key] = entry
+
+    def evict(self):
+        """Removes least recently used entries from memory."""
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def info(self):
+        """Returns a string with hit and miss counters."""
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0
+
+        return (f"Cache: {self.hits} hit(s), {self.misses} miss(es) "
+                f"({ratio:.1f}% hits).")
+
+    def close(self):
+        """Closes the on-disk store."""
+        with self.lock:
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+
+class Uncached:
+    """
+    Wraps a result of a cached function that is returned to the caller
+    but not cached (an incomplete or empty result).
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
+def cached(cache, endpoint, ttl):
+    """
+    Caches results of an api function `function(session, *args)` in
+    `cache` for `ttl` seconds. `session` is not a part of the key.  
+
+    `None` results (errors) and results wrapped in `Uncached` are not
+    cached. Returns copies of cached values, so callers can change them.
+    """
+    def decorator(function):
+
+        @wraps(function)
+        def wrapper(session, *args):
+            key = ":".join([endpoint] + [str(arg) for arg in args])
+
+            found, value = cache.get(key)
+            if not found:
+                value = function(session, *args)
+                if isinstance(value, Uncached):
+                    value = value.value
+                elif value is not None:
+                    cache.set(key, value, ttl)
+
+            return copy.copy(value)
+
+        return wrapper
+
+    return decorator
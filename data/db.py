@@ -23,7 +23,12 @@ SOFTWARE.
 """
 
 """
-This file connects to a database and creates tables if they don't exist.  
+This file connects to a database, creates tables if they don't exist and
+adds columns and indexes missing in existing tables.  
+
+The database is postgres or an embedded SQLite file (`DB_BACKEND` in
+`config.py`). SQLite connections use WAL journal mode, so readers don't
+block the harvester writes.  
 
 Made with:  
 https://docs.sqlalchemy.org/en/13/orm/tutorial.html#object-relational-tutorial
@@ -31,19 +36,20 @@ https://docs.sqlalchemy.org/en/13/orm/tutorial.html#object-relational-tutorial
 
 from datetime import datetime
 
-from sqlalchemy import (create_engine,
+from sqlalchemy import (create_engine, event, inspect,
                         ForeignKey,
-                        Column, Integer, String, DateTime)
-from sqlalchemy.engine.url import URL
+                        Column, Integer, BigInteger, String, DateTime)
+from sqlalchemy.engine.url import URL, make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
-from config import DB_NAME, DB_HOST, DB_PORT, DB_USER, DB_PASSWORD
+from config import (DB_BACKEND, SQLITE_PATH,
+                    DB_NAME, DB_HOST, DB_PORT, DB_USER, DB_PASSWORD)
 
 
-# Connect to postgres database.
+# Postgres database.
 DATABASE = {
-    'drivername': 'postgres',
+    'drivername': 'postgresql',
     'host': DB_HOST,
     'port': DB_PORT,
     'username': DB_USER,
@@ -51,7 +57,58 @@ DATABASE = {
     'database': DB_NAME
 }
 
-engine = create_engine(URL(**DATABASE), echo=False)
+# SQLite pragmas set on every connection.
+SQLITE_PRAGMAS = {
+    # Readers and the writer don't block each other.
+    'journal_mode': 'WAL',
+    # Sync on checkpoints only, safe with WAL.
+    'synchronous': 'NORMAL',
+    # 64 MB page cache.
+    'cache_size': -65536,
+    'temp_store': 'MEMORY',
+    'mmap_size': 268435456,
+    # Wait for locks held by other processes (`db_sync`) for 30 seconds.
+    'busy_timeout': 30000,
+    'foreign_keys': 'ON',
+}
+
+
+def database_url():
+    """Returns the database url for `DB_BACKEND`."""
+    if DB_BACKEND == "sqlite":
+        return URL(drivername='sqlite', database=SQLITE_PATH)
+    elif DB_BACKEND == "postgres":
+        return URL(**DATABASE)
+
+    raise ValueError(f"Unknown database backend: {DB_BACKEND}")
+
+
+def make_engine(url):
+    """
+    Creates an engine for `url`, sets SQLite pragmas on SQLite connections.  
+
+    Harvester threads share the engine, so SQLite connections are allowed
+    to be used from any thread.
+    """
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite':
+        return create_engine(url, echo=False)
+
+    engine = create_engine(url, echo=False,
+                           connect_args={'check_same_thread': False})
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+
+# Connect to the database.
+engine = make_engine(database_url())
 Session = sessionmaker(bind=engine)
 
 
@@ -65,12 +122,15 @@ class Game(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String)
     frames = Column(Integer)
+    # Total size of frames in bytes.
+    size = Column(BigInteger, server_default='0')
 
     def __repr__(self):
         return (f"<Game("
                         f"id='{self.id}', "
                         f"name='{self.name}', "
-                        f"frames='{self.frames}'"
+                        f"frames='{self.frames}', "
+                        f"size='{self.size}'"
                 ")>")
 
 class Frame(Base):
@@ -78,10 +138,12 @@ class Frame(Base):
     __tablename__ = "frames"
 
     id = Column(Integer, primary_key=True)
-    path = Column(String)
-    game_id = Column(Integer, ForeignKey(Game.id))
+    path = Column(String, index=True)
+    game_id = Column(Integer, ForeignKey(Game.id), index=True)
     user_login = Column(String)
-    date = Column(DateTime, default=datetime.utcnow)
+    date = Column(DateTime, default=datetime.utcnow, index=True)
+    # Frame size in bytes, `NULL` for frames added by older versions.
+    size = Column(Integer)
 
     def __repr__(self):
         return (f"<Frame("
@@ -89,9 +151,40 @@ class Frame(Base):
                         f"path='{self.path}', "
                         f"game_id='{self.game_id}', "
                         f"user_login='{self.user_login}', "
-                        f"date='{self.date}'"
+                        f"date='{self.date}', "
+                        f"size='{self.size}'"
                 ")>")
 
 
-# Create tables if they don't exist.
+def migrate(engine):
+    """
+    Adds columns and creates indexes that are missing in existing tables.  
+
+    `create_all` creates columns and indexes only with new tables, so
+    databases created by older versions get them here.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        columns = {column['name']
+                   for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                print(f"Adding column {table.name}.{column.name}.")
+                definition = (f"{column.name} "
+                              f"{column.type.compile(engine.dialect)}")
+                if column.server_default is not None:
+                    definition += f" DEFAULT {column.server_default.arg}"
+                engine.execute(f"ALTER TABLE {table.name} "
+                               f"ADD COLUMN {definition}")
+
+        existing = {index['name']
+                    for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                print(f"Creating index {index.name}.")
+                index.create(engine)
+
+
+# Create tables if they don't exist, add missing columns and indexes.
 Base.metadata.create_all(engine)
+migrate(engine)
@@ -29,27 +29,52 @@ functions to contact the database.
 Functions:  
     1) Session context manager.  
     2) Update `games` table with new games.  
-    3) Update `frames` (frame count) for every game in `games` table.  
-    4) Find a category (game ID) with minimum number of frames.  
-    5) Get game ID and frame count for a category with a minimum
+    3) Get the number of games and the number of frames.  
+    4) Get the number of games, frames and the data size.  
+    5) Update `frames` (frame count) and `size` for every game in `games`
+    table.  
+    6) Get games with frames added after a specified date.  
+    7) Find a category (game ID) with minimum number of frames.  
+    8) Get game ID and frame count for a category with a minimum
     number of frames.  
-    6) Get game ID and frame count for a category with a maximum
+    9) Get game ID and frame count for a category with a maximum
     number of frames.  
-    7) Add frame information to `frames` table.  
-    8) Get game name from game ID. (not used)  
-    9) Delete frames from `frames` table that are were from the
-    downloaded data.
+    10) Add frame information to `frames` table.  
+    11) Buffered writer that adds frames to `frames` table in batches.  
+    12) Get game names for a list of game IDs.  
+    13) Delete frames from `frames` table that are were from the
+    downloaded data.  
+    14) Record frame sizes of the downloaded data.  
+    15) Walk the downloaded data.
 """
 
+import os
+import time
+from collections import Counter
 from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
+from threading import Lock
+
+from sqlalchemy import (func, exists, or_, MetaData, Table,
+                        Column, String, Integer)
 
 from data.db import Session
 from data.db import Game, Frame
+from data.shards import (data_path, category_shards, shard_frames,
+                         shard_frame_sizes)
+from data.metrics import counter, histogram
+
+from config import (MAX_GAMES, STORAGE_FORMAT,
+                    FLUSH_FRAMES, FLUSH_SECONDS,
+                    SYNC_BATCH, SYNC_PROGRESS)
 
-from config import DOWNLOAD_PATH, MAX_GAMES
+# Frame writer metrics.
+flush_seconds = histogram('db_flush_seconds',
+                          "Time to write a batch of frames in seconds.")
+flushed_frames = counter('db_flushed_frames_total',
+                         "Frames written to the database.")
 
-DATA_PATH = Path.joinpath(Path(DOWNLOAD_PATH), "frames")
 
 @contextmanager
 def session_scope():
@@ -78,6 +103,9 @@ def update_games(session, games):
     """
     game_count = get_game_count(session)
 
+    # Get IDs of games in the database.
+    existing = {id for id, in session.query(Game.id)}
+
     for game in games:
         
         id = game
@@ -85,8 +113,7 @@ def update_games(session, games):
 
         # Check if the game already exists in the database and game limit
         # is not exceeded.
-        if (not session.query(Game).filter_by(id=id).all()
-            and game_count < MAX_GAMES):
+        if int(id) not in existing and game_count < MAX_GAMES:
 
             # Insert the game in the table.
             game = Game(id=id, name=name, frames=0)
@@ -97,20 +124,57 @@ def update_games(session, games):
 
 def get_game_count(session):
     """Returns the number of games in the `games` table."""
-    return len(session.query(Game).all())
+    return session.query(func.count(Game.id)).scalar()
+
+
+def get_frame_count(session):
+    """Returns the number of frames in the `frames` table."""
+    return session.query(func.count(Frame.id)).scalar()
 
 
-def update_frame_count(session):
-    """Updates `frames` (frame count) for every game in `games` table."""
-    # Get all games.
-    for game in session.query(Game).all():
+def get_data_totals(session):
+    """
+    Returns tuple (`games`, `frames`, `size`): the number of games, frames
+    and the data size in bytes from `games` table counters.
+    """
+    games, frames, size = session.query(
+        func.count(Game.id),
+        func.coalesce(func.sum(Game.frames), 0),
+        func.coalesce(func.sum(Game.size), 0)
+    ).one()
 
-        # Get game frame number.
-        frames = session.query(Frame).filter_by(game_id=game.id).count()
+    return games, int(frames), int(size)
 
-        # Update game `frames`.
-        game = session.query(Game).filter_by(id=game.id).one()
-        game.frames = frames
+
+def update_frame_count(session, game_ids=None):
+    """
+    Updates `frames` (frame count) and `size` for every game in `games`
+    table with a single `UPDATE` statement counted by the database.  
+
+    Only games from `game_ids` are recounted if passed (incremental mode).
+    """
+    # Frame count and size of a game.
+    frame_count = session.query(func.count(Frame.id)).\
+                          filter(Frame.game_id == Game.id).\
+                          correlate(Game).as_scalar()
+    frame_size = session.query(func.coalesce(func.sum(Frame.size), 0)).\
+                         filter(Frame.game_id == Game.id).\
+                         correlate(Game).as_scalar()
+
+    query = session.query(Game)
+    if game_ids is not None:
+        if not game_ids:
+            return
+        query = query.filter(Game.id.in_(list(game_ids)))
+
+    query.update({Game.frames: frame_count, Game.size: frame_size},
+                 synchronize_session=False)
+
+
+def touched_games(session, since):
+    """Returns a set of game IDs with frames added after `since` date."""
+    return {game_id for game_id, in
+            session.query(Frame.game_id).filter(Frame.date > since).distinct()}
 
 
 def min_data_category(session):
@@ -118,15 +182,14 @@ def min_data_category(session):
     Returns game ID and frame count for a category with a minimum
     number of frames.
     """
-    # Ensure the table is not empty.
-    if session.query(Game).all():
-
-        # Get game ID and frame count.
-        game_id, frame_count = session.query(Game.id, Game.frames).\
-                                     order_by(Game.frames).first()
-    else:
+    # Get game ID and frame count, `None` if there are no categories.
+    category = session.query(Game.id, Game.frames).\
+                       order_by(Game.frames).first()
+    if not category:
         return None
 
+    game_id, frame_count = category
+
     return game_id, frame_count
 
 
@@ -135,71 +198,269 @@ def max_data_category(session):
     Returns game ID and frame count for a category with a maximum
     number of frames.
     """
-    # Ensure the table is not empty.
-    if session.query(Game).all():
-
-        # Get game ID and frame count.
-        game_id, frame_count = session.query(Game.id, Game.frames).\
-                                     order_by(Game.frames.desc()).first()
-    else:
+    # Get game ID and frame count, `None` if the table is empty.
+    category = session.query(Game.id, Game.frames).\
+                       order_by(Game.frames.desc()).first()
+    if not category:
         return None
 
+    game_id, frame_count = category
+
     return game_id, frame_count
 
 
-def add_frame(session, path, game_id, login):
+def add_frame(session, path, game_id, login, size=None):
     """
-    Adds frame information to `frames` table, updates `frames` column
-    in `games` table.
+    Adds frame information to `frames` table, updates `frames` and `size`
+    columns in `games` table.
     """
     # Update `frames` table.
-    frame = Frame(path=path, game_id=game_id, user_login=login)
+    frame = Frame(path=path, game_id=game_id, user_login=login, size=size)
     session.add(frame)
 
     # Update `games` table.
-    game = session.query(Game).filter_by(id=game_id).one()
-    game.frames += 1
+    session.query(Game).filter_by(id=game_id).\
+            update({Game.frames: Game.frames + 1,
+                    Game.size: Game.size + (size or 0)},
+                   synchronize_session=False)
+
+
+class FrameWriter:
+    """
+    Thread-safe buffer that adds frames to the database in batches.  
 
+    Collects `frames` rows and frame count and size changes for every
+    game. Flushes them with a bulk insert and one
+    `UPDATE games SET frames = frames + n, size = size + s` per game
+    when `max_frames` frames are buffered or `max_seconds` seconds passed
+    since the last flush. `flush` must be called on shutdown.
+    """
+
+    def __init__(self, max_frames=FLUSH_FRAMES, max_seconds=FLUSH_SECONDS):
+        self.max_frames = max_frames
+        self.max_seconds = max_seconds
+        self.lock = Lock()
+
+        self.rows = []
+        self.counts = Counter()
+        self.sizes = Counter()
+        self.flushed = time.monotonic()
+
+    def add(self, path, game_id, login, size=None):
+        """Buffers frame information, flushes the buffer if needed."""
+        with self.lock:
+            self.buffer({'path': path,
+                         'game_id': game_id,
+                         'user_login': login,
+                         'date': datetime.utcnow(),
+                         'size': size})
+
+            if (len(self.rows) >= self.max_frames
+                    or time.monotonic() - self.flushed >= self.max_seconds):
+                self.write()
+
+    def buffer(self, row):
+        """Buffers a `frames` row. Must be called with `lock` acquired."""
+        self.rows.append(row)
+        self.counts[row['game_id']] += 1
+        self.sizes[row['game_id']] += row['size'] or 0
+
+    def flush(self):
+        """Writes buffered frames to the database."""
+        with self.lock:
+            self.write()
+
+    def write(self):
+        """Writes buffered frames. Must be called with `lock` acquired."""
+        rows, counts, sizes = self.rows, self.counts, self.sizes
+        self.rows, self.counts, self.sizes = [], Counter(), Counter()
+        self.flushed = time.monotonic()
+
+        if not rows:
+            return
+
+        with flush_seconds.time(), session_scope() as session:
+            session.bulk_insert_mappings(Frame, rows)
+
+            for game_id, count in counts.items():
+                session.query(Game).filter_by(id=game_id).\
+                        update({Game.frames: Game.frames + count,
+                                Game.size: Game.size + sizes[game_id]},
+                               synchronize_session=False)
+
+        flushed_frames.inc(len(rows))
+
+
+def game_ids_to_names(session, game_ids):
+    """
+    Returns a dictionary of format {game_id: game_name} for games from
+    `game_ids` that are in `games` table. Game IDs are strings.
+    """
+    game_ids = [int(game_id) for game_id in game_ids]
+    if not game_ids:
+        return dict()
 
-def game_id_to_name(session, gameID):
-    """Converts game ID to name."""
-    return session.query(Game.name).filter_by(id=gameID).one()[0]
+    return {str(id): name for id, name in
+            session.query(Game.id, Game.name).filter(Game.id.in_(game_ids))}
 
 
-def sync_db(session):
+def sync_db(session, dry_run=False):
     """
     Deletes categories from `games` table and frames from `frames` table that
     were deleted from the downloaded data.  
     
     Also deletes categories, frames for which weren't downloaded yet.  
 
-    Used for updating the database after data cleaning.
+    Walks the downloaded data once, loads frame paths into a temporary
+    table and deletes missing frames with one `DELETE ... WHERE NOT EXISTS`.
+    Only prints what would be deleted if `dry_run` is `True`.  
+
+    Used for updating the database after data cleaning.  
+    Returns a set of IDs of remaining games that had frames deleted.
     """
-    data_path = DATA_PATH
-    categories = list(p.name for p in data_path.glob('*'))
+    connection = session.connection()
+
+    # Create a temporary table for paths of downloaded frames.
+    disk_frames = Table('disk_frames', MetaData(),
+                        Column('path', String, primary_key=True),
+                        prefixes=['TEMPORARY'])
+    disk_frames.create(connection)
+
+    # Load downloaded frame paths.
+    categories = set()
+    batch = []
+    count = 0
+    for game_id, path in walk_data(data_path):
+        categories.add(game_id)
+        batch.append({'path': path})
+        count += 1
+
+        if len(batch) == SYNC_BATCH:
+            connection.execute(disk_frames.insert(), batch)
+            batch = []
+
+        if count % SYNC_PROGRESS == 0:
+            print(f"Scanned {count} frame(s).")
+
+    if batch:
+        connection.execute(disk_frames.insert(), batch)
+    print(f"Scanned {count} frame(s) in {len(categories)} categories.")
+
+    # Frames and categories that were deleted from the downloaded data.
+    missing = ~exists().where(disk_frames.c.path == Frame.path)
+    removed_games = session.query(Game)
+    if categories:
+        removed_games = removed_games.filter(Game.id.notin_(categories))
+
+    # Get games that have missing frames.
+    missing_counts = session.query(Frame.game_id, func.count(Frame.id)).\
+                             filter(missing).group_by(Frame.game_id).all()
+    removed_ids = {game_id for game_id, in
+                   removed_games.with_entities(Game.id)}
+
+    if dry_run:
+        for game_id, frames in missing_counts:
+            print(f"Game ID {game_id}: {frames} missing frame(s)."
+                  + (" Category removed." if game_id in removed_ids else ""))
+        print(f"Would delete {len(removed_ids)} game(s) and "
+              f"{sum(frames for _, frames in missing_counts)} frame(s).")
+    else:
+        # Delete removed frames and categories from the database.
+        session.query(Frame).filter(missing).\
+                delete(synchronize_session=False)
+        removed_games.delete(synchronize_session=False)
 
-    # Get downloaded frames.
-    frames = dict()
-    for category in categories:
-        category_path = Path.joinpath(data_path, category)
-        category_frames = [p.name for p in category_path.glob('*')]
-        frames[category] = category_frames
-    
-    # Delete removed categories from the database.
-    for game in session.query(Game).all():
+    disk_frames.drop(connection)
 
-        if game.id not in list(map(int, categories)):
+    return {game_id for game_id, _ in missing_counts} - removed_ids
 
-            # Delete all frames in that category.
-            for frame in session.query(Frame).filter_by(game_id=game.id).all():
-                session.delete(frame)
 
-            session.commit()
-            
-            # Delete category from `games` table.
-            session.delete(game)
+def rescan_sizes(session):
+    """
+    Records sizes of downloaded frames in `frames` table and recounts
+    `size` of every game.  
+
+    Walks the downloaded data once, loads frame sizes into a temporary
+    table and updates frames with unknown or changed sizes with one
+    `UPDATE`. Used to verify the `games` size counters and to record
+    sizes of frames added by older versions.  
 
-    # Delete removed frames from the database.
-    for frame in session.query(Frame).all():
-        if Path(frame.path).name not in frames[str(frame.game_id)]:
-            session.delete(frame)
+    Returns tuple (`disk_size`, `counted_size`): the size of frames on
+    disk and the total of size counters before the rescan in bytes.
+    """
+    connection = session.connection()
+    counted_size = get_data_totals(session)[2]
+
+    # Create a temporary table for paths and sizes of downloaded frames.
+    disk_sizes = Table('disk_sizes', MetaData(),
+                       Column('path', String, primary_key=True),
+                       Column('size', Integer),
+                       prefixes=['TEMPORARY'])
+    disk_sizes.create(connection)
+
+    # Load downloaded frame sizes.
+    disk_size = 0
+    batch = []
+    count = 0
+    for _, path, size in walk_data(data_path, sizes=True):
+        batch.append({'path': path, 'size': size})
+        disk_size += size
+        count += 1
+
+        if len(batch) == SYNC_BATCH:
+            connection.execute(disk_sizes.insert(), batch)
+            batch = []
+
+        if count % SYNC_PROGRESS == 0:
+            print(f"Scanned {count} frame(s).")
+
+    if batch:
+        connection.execute(disk_sizes.insert(), batch)
+    print(f"Scanned {count} frame(s).")
+
+    # Update frames with unknown or changed sizes, recount games.
+    size = session.query(disk_sizes.c.size).\
+                   filter(disk_sizes.c.path == Frame.path).\
+                   correlate(Frame).as_scalar()
+    changed = exists().where(disk_sizes.c.path == Frame.path).\
+                       where(or_(Frame.size.is_(None),
+                                 Frame.size != disk_sizes.c.size))
+    session.query(Frame).filter(changed).\
+            update({Frame.size: size}, synchronize_session=False)
+    update_frame_count(session)
+
+    disk_sizes.drop(connection)
+
+    return disk_size, counted_size
+
+
+def walk_data(data_path, sizes=False):
+    """
+    Walks the downloaded data once.  
+
+    Yields tuples (`game_id`, `path`) for every frame, where `path` is
+    the frame path saved in `frames` table, or (`game_id`, `path`, `size`)
+    if `sizes` is `True`.
+    """
+    for category in os.scandir(data_path):
+        if not (category.is_dir() and category.name.isdigit()):
+            continue
+
+        game_id = int(category.name)
+        category_path = Path(category.path)
+
+        if STORAGE_FORMAT == "shards" and sizes:
+            for shard in category_shards(category_path):
+                for path, size in shard_frame_sizes(shard).items():
+                    yield game_id, path, size
+        elif STORAGE_FORMAT == "shards":
+            for shard in category_shards(category_path):
+                for path in shard_frames(shard):
+                    yield game_id, path
+        else:
+            for frame in os.scandir(category_path):
+                path = str(Path.joinpath(Path(category.name), frame.name))
+                if sizes:
+                    yield game_id, path, frame.stat().st_size
+                else:
+                    yield game_id, path
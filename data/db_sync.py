@@ -22,29 +22,63 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-"""This file updates the database after data cleaning."""
+"""
+This file updates the database after data cleaning.  
+
+Usage: python -m data.db_sync [--incremental] [--dry-run]  
+
+With `--incremental` only games with deleted frames and games with frames
+added since the last sync are recounted. With `--dry-run` only prints
+what would be deleted.
+"""
+
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+from data.db_functions import (sync_db, update_frame_count, touched_games,
+                               get_game_count, get_frame_count, session_scope)
+
+from config import DOWNLOAD_PATH
 
-from data.db import Game, Frame
-from data.db_functions import sync_db, update_frame_count, session_scope
+# File with the date of the last sync.
+last_sync_path = Path.joinpath(Path(DOWNLOAD_PATH), "last_sync.txt")
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
 
-def sync():
+
+def sync(incremental=False, dry_run=False):
     """
     Deletes categories from `games` table and frames from `frames` table that
     were deleted from the downloaded data and prints the number of deleted
-    categories and frames.
+    categories and frames.  
+
+    Recounts frames only for touched games if `incremental` is `True` and
+    the date of the last sync is known. Doesn't change the database if
+    `dry_run` is `True`.
     """
+    sync_date = datetime.utcnow()
+    last_sync = get_last_sync() if incremental else None
 
     with session_scope() as session:
 
-        games_before = len(session.query(Game).all())
-        frames_before = len(session.query(Frame).all())
+        games_before = get_game_count(session)
+        frames_before = get_frame_count(session)
 
         # Update the database.
-        sync_db(session)
-        update_frame_count(session)
+        touched = sync_db(session, dry_run)
+        if dry_run:
+            return
+        elif last_sync:
+            touched |= touched_games(session, last_sync)
+            update_frame_count(session, touched)
+            print(f"Recounted frames of {len(touched)} game(s).")
+        else:
+            update_frame_count(session)
+
+        games_after = get_game_count(session)
+        frames_after = get_frame_count(session)
 
-        games_after = len(session.query(Game).all())
-        frames_after = len(session.query(Frame).all())
+    last_sync_path.write_text(sync_date.strftime(DATE_FORMAT))
 
     deleted_games = games_before - games_after
     deleted_frames = frames_before - frames_after
@@ -53,5 +87,22 @@ def sync():
            "from the database.")
 
 
+def get_last_sync():
+    """Returns the date of the last sync or `None` if unknown."""
+    try:
+        return datetime.strptime(last_sync_path.read_text().strip(),
+                                 DATE_FORMAT)
+    except (OSError, ValueError):
+        return None
+
+
 if __name__ == "__main__":
-    sync()
+    parser = argparse.ArgumentParser(description="Sync the database with "
+                                                 "the downloaded data.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="recount frames only for touched games")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="only print what would be deleted")
+    args = parser.parse_args()
+
+    sync(args.incremental, args.dry_run)
@@ -0,0 +1,124 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file finds near-duplicate frames with perceptual hashes.  
+
+Functions and classes:  
+    1) Difference hash (dHash) of a frame.  
+    2) Hamming distance between two hashes.  
+    3) Per-category index of frame hashes.
+"""
+
+from threading import Lock
+
+import cv2 as cv
+import numpy as np
+
+# Hash size in bits.
+HASH_BITS = 64
+
+
+def dhash(frame):
+    """
+    Returns a 64-bit difference hash of a BGR `frame`.  
+
+    The frame is converted to grayscale and shrunk to 9x8, every bit
+    tells whether a pixel is brighter than its left neighbour.
+    """
+    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    small = cv.resize(gray, (9, 8), interpolation=cv.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(hash_1, hash_2):
+    """Returns the number of different bits in two hashes."""
+    return bin(hash_1 ^ hash_2).count('1')
+
+
+class HashIndex:
+    """
+    Thread-safe in-memory index of frame hashes for every category.  
+
+    Hashes are split into `distance` + 1 chunks. Two hashes within
+    `distance` bits of each other have at least one equal chunk, so only
+    hashes that share a chunk with a new hash are compared with it.
+    """
+
+    def __init__(self, distance):
+        self.distance = distance
+        self.lock = Lock()
+
+        # {game_id: [{chunk: [hash, ...]} for every chunk]}
+        self.tables = dict()
+
+        # Number of skipped near-duplicate frames.
+        self.skipped = 0
+
+        # Chunk (shift, mask) pairs.
+        chunk_count = distance + 1
+        self.chunks = []
+        start = 0
+        for i in range(chunk_count):
+            width = HASH_BITS // chunk_count + (i < HASH_BITS % chunk_count)
+            self.chunks.append((start, (1 << width) - 1))
+            start += width
+
+    def keys(self, frame_hash):
+        """Returns chunks of `frame_hash` used as table keys."""
+        return [(frame_hash >> shift) & mask for shift, mask in self.chunks]
+
+    def check(self, game_id, frame):
+        """
+        Returns `frame` hash, or `None` if `game_id` category index has a
+        hash within `distance` bits.  
+
+        The hash isn't added, `insert` it after the frame is stored.
+        """
+        frame_hash = dhash(frame)
+        keys = self.keys(frame_hash)
+
+        with self.lock:
+            # Compare with hashes that share a chunk.
+            for table, key in zip(self.tables.get(game_id, ()), keys):
+                for candidate in table.get(key, ()):
+                    distance = hamming_distance(frame_hash, candidate)
+                    if distance <= self.distance:
+                        self.skipped += 1
+                        return None
+
+            return frame_hash
+
+    def insert(self, game_id, frame_hash):
+        """Adds `frame_hash` to `game_id` category index."""
+        keys = self.keys(frame_hash)
+
+        with self.lock:
+            tables = self.tables.setdefault(
+                game_id, [dict() for _ in self.chunks]
+            )
+            for table, key in zip(tables, keys):
+                table.setdefault(key, []).append(frame_hash)
@@ -27,9 +27,10 @@ This file downloads frames from streams in top categories of twitch.
 
 Pseudocode:  
     while `Enter` is not pressed:  
-        Loop:  
+        Loop (in `HARVEST_WORKERS` parallel workers):  
         1) Get top games from twitch api, save them in a database.  
-        2) Get a game with a minimum number of saved frames.  
+        2) Get a game with a minimum number of saved frames that is not
+        harvested by another worker from the in-memory scheduler.  
         3) Get logins of streams that are live in that category.  
         4) Download frames from 5 random streams,
         save frame info in the database.
@@ -37,104 +38,225 @@ Pseudocode:
 
 import random
 import time
-import requests
-from threading import Thread
-from pathlib import Path
+from threading import Thread, Lock
 from termcolor import colored
 
 from streamlink import Streamlink
 
-from data.download_functions import download_frames
-from data.api import get_top_games, get_streams
-from data.db_functions import (session_scope, get_game_count, update_games,
-                               min_data_category, max_data_category, add_frame)
+from data.download_functions import download_frames, hash_index, shard_writer
+from data.api import (create_session, get_top_games, get_streams,
+                      api_cache)
+from data.db_functions import (session_scope, get_data_totals, update_games,
+                               min_data_category, max_data_category)
+from data.scheduler import CategoryScheduler
+from data.writer import AsyncFrameWriter
+from data.metrics import counter, start_server
 
-from config import DOWNLOAD_PATH, MAX_GAMES
+from config import MAX_GAMES, HARVEST_WORKERS, METRICS_PORT
 
-data_path = Path.joinpath(Path(DOWNLOAD_PATH), "frames")
+# Saved frames by category.
+saved_frames = counter('harvester_frames_total', "Saved frames.", ['game_id'])
 
 
 def update_data():
     """Updates data while no input (Enter not pressed)."""
+    # Statistics of every worker.
+    stats = [new_worker_stats(i) for i in range(1, HARVEST_WORKERS + 1)]
+
     # Start helper threads.
     input_list = []
     Thread(target=input_thread, args=(input_list, )).start()
     print("Press Enter any time to stop downloading.")
 
-    Thread(target=info_thread, args=(input_list, )).start()
+    # Start a writer thread that adds frames to the database in batches.
+    frame_writer = AsyncFrameWriter()
+
+    Thread(target=info_thread, args=(input_list, stats, frame_writer)).start()
+
+    # Serve metrics.
+    if METRICS_PORT:
+        try:
+            start_server(METRICS_PORT)
+            print(f"Metrics at http://localhost:{METRICS_PORT}/metrics.")
+        except OSError as e:
+            print(f"Couldn't start the metrics server: {e}")
+
+    # Start a pooled http session shared by workers for api and
+    # stream requests.
+    http_session = create_session()
+
+    # Scheduler that chooses categories and a lock for adding games.
+    scheduler = CategoryScheduler()
+    with session_scope() as db_session:
+        scheduler.load(db_session)
+    lock = Lock()
+
+    # Start workers and wait for them to stop.
+    workers = [Thread(target=harvest_worker,
+                      args=(input_list, http_session, frame_writer,
+                            scheduler, lock, worker_stats))
+               for worker_stats in stats]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    finally:
+        # Save queued frames, stop the writer thread.
+        frame_writer.close()
+
+        if shard_writer:
+            shard_writer.close()
+
+    print_dataset_info()
+    print_worker_stats(stats)
+    print(colored(api_cache.info(), 'green'))
+    print(colored(frame_writer.info(), 'green'))
+
+    frame_count = sum(worker_stats['frames'] for worker_stats in stats)
+    downloaded_streams = sum(worker_stats['streams'] for worker_stats in stats)
+    fail_count = sum(worker_stats['fails'] for worker_stats in stats)
+
+    print("Done.")
+    print(f"Downloaded {frame_count} frame(s) from {downloaded_streams} "
+          f"stream(s). Failed {fail_count} time(s).")
+    if hash_index:
+        print(f"Skipped {hash_index.skipped} duplicate frame(s).")
+
+
+def harvest_worker(input_list, http_session, frame_writer,
+                   scheduler, lock, stats):
+    """
+    Worker thread. Downloads frames from streams in a category with the
+    minimum number of frames that is not harvested by other workers while
+    no input (Enter not pressed).  
+
+    `http_session` is a pooled session shared by workers.
+    `frame_writer` is an `AsyncFrameWriter` shared by workers.
+    `scheduler` is a `CategoryScheduler` shared by workers.
+    `lock` guards the `games` table updates.
+    `stats` is the worker statistics dictionary.
+    """
+    worker_id = stats['id']
 
     # Start a streamlink session.
     streamlink_session = Streamlink()
 
-    # Start an api session.
-    api_session = requests.session()
-
-    downloaded_streams = 0
-    fail_count = 0
-    frame_count = 0
     while not input_list:
 
         # Add games if game limit is not exceeded.
-        with session_scope() as db_session:
-            game_count = get_game_count(db_session)
+        if len(scheduler) < MAX_GAMES:
+            with lock:
+
+                games = get_top_games(http_session)
 
-        if game_count < MAX_GAMES:
+                # Update the database with new games, reload the scheduler.
+                if games and set(map(int, games)) - scheduler.game_ids():
+                    frame_writer.flush()
+                    with session_scope() as db_session:
+                        update_games(db_session, games)
+                    with session_scope() as db_session:
+                        scheduler.load(db_session)
 
-            games = get_top_games(api_session)
+            # Wait (without holding the lock) before asking the api again.
             if not games:
-                print("Error. Could not get top games.")
+                print(f"[{worker_id}] Error. Could not get top games.")
+                time.sleep(10)
                 continue
-        
-            # Update the database with new games.
+
+        # Sync frame counts with the database periodically.
+        if scheduler.needs_sync():
+            frame_writer.flush()
             with session_scope() as db_session:
-                update_games(db_session, games)
+                scheduler.load(db_session)
 
-        # Get a category with the minimum number of frames.
-        with session_scope() as db_session:
-            game_id = min_data_category(db_session)[0]
+        # Get a category with the minimum number of frames that is not
+        # harvested by other workers.
+        game_id = scheduler.claim()
 
-        # Get streams from the category.
-        streams = get_streams(api_session, game_id)
-        if not streams:
-            print("Error. Could not get streams.")
+        # Wait if every category is harvested by other workers.
+        if game_id is None:
+            time.sleep(1)
             continue
-        
-        # Update the category (download frames from 5 streams).
-        download_count = 0
-        download_attempts = 0
-        while streams and download_count < 5 and download_attempts < 10:
-
-            if input_list:
-                break
-
-            # Get a random stream.
-            stream = random.choice(list(streams))
-            streams.discard(stream)
-
-            # Download frames from a stream, update the database.
-            print(f"Downloading frames from '{stream}', gameID: {game_id}.")
-            download = False
-            for frame_path in download_frames(streamlink_session,
-                                              stream, game_id):
-
-                # Save a frame in the database.
-                with session_scope() as db_session:
-                    add_frame(db_session, frame_path, game_id, stream)
-
-                download = True
-                frame_count += 1
-            
-            download_count += download
-            download_attempts += 1
-
-            downloaded_streams += download
-            fail_count += not download
 
-    print_dataset_info()
+        try:
+            harvest_category(input_list, streamlink_session, http_session,
+                             frame_writer, scheduler, game_id, stats)
+        finally:
+            scheduler.release(game_id)
 
-    print("Done.")
-    print(f"Downloaded {frame_count} frame(s) from {downloaded_streams} "
-          f"stream(s). Failed {fail_count} time(s).")
+
+def harvest_category(input_list, streamlink_session, http_session,
+                     frame_writer, scheduler, game_id, stats):
+    """
+    Downloads frames from 5 random streams in `game_id` category,
+    saves frame info in the database and updates worker `stats`.
+    """
+    worker_id = stats['id']
+
+    # Get streams from the category.
+    streams = get_streams(http_session, game_id)
+    if not streams:
+        print(f"[{worker_id}] Error. Could not get streams.")
+        return
+
+    # Update the category (download frames from 5 streams).
+    download_count = 0
+    download_attempts = 0
+    while streams and download_count < 5 and download_attempts < 10:
+
+        if input_list:
+            break
+
+        # Get a random stream.
+        stream = random.choice(list(streams))
+        streams.discard(stream)
+
+        # Download frames from a stream, update the database.
+        print(f"[{worker_id}] Downloading frames from '{stream}', "
+              f"gameID: {game_id}.")
+        download = False
+        for frame_path, size in download_frames(streamlink_session,
+                                                stream, game_id, http_session):
+
+            # Save a frame in the database.
+            frame_writer.add(frame_path, game_id, stream, size)
+            scheduler.add_frames(game_id)
+            saved_frames.inc(game_id=game_id)
+
+            download = True
+            stats['frames'] += 1
+
+        download_count += download
+        download_attempts += 1
+
+        stats['streams'] += download
+        stats['fails'] += not download
+
+
+def new_worker_stats(worker_id):
+    """Returns an empty statistics dictionary for a worker."""
+    return {
+        'id': worker_id,
+        'frames': 0,
+        'streams': 0,
+        'fails': 0,
+        'start': time.time()
+    }
+
+
+def print_worker_stats(stats):
+    """Prints the number of frames and throughput of every worker."""
+    for worker_stats in stats:
+        minutes = (time.time() - worker_stats['start']) / 60
+        print(colored("Worker {}: {} frame(s) from {} stream(s), "
+                      "{:.1f} frame(s)/min."
+                      .format(worker_stats['id'],
+                              worker_stats['frames'],
+                              worker_stats['streams'],
+                              worker_stats['frames'] / minutes),
+                      'green'))
 
 
 def input_thread(input_list):
@@ -144,10 +266,10 @@ def input_thread(input_list):
     print(colored("Interrupting. Please wait.", 'green'))
 
 
-def info_thread(input_list):
+def info_thread(input_list, stats, frame_writer):
     """
-    Thread that shows how much data is downloaded and min/max data categories
-    every `n` seconds.
+    Thread that shows how much data is downloaded, min/max data categories,
+    worker `stats` and `frame_writer` queue statistics every `n` seconds.
     """
     n = 300
     
@@ -163,35 +285,27 @@ def info_thread(input_list):
         i = 0
 
         print_dataset_info()
-
+        print_worker_stats(stats)
+        print(colored(api_cache.info(), 'green'))
+        print(colored(frame_writer.info(), 'green'))
 
 
 def print_dataset_info():
     """Prints dataset info."""
-    # Print dataset size.
-    print(colored(dir_size(data_path), 'green'))
-
-    # Print the number of games.
+    # Get the dataset size and the number of games and frames from
+    # `games` table counters.
     with session_scope() as db_session:
-        game_count = get_game_count(db_session)
-    print(colored(f"{game_count} game(s)", 'green'))
-    
-    # Print categories with minumum and maximum number of frames.
-    print_min_max()
+        game_count, frame_count, size = get_data_totals(db_session)
 
+    # Print dataset size (in GB).
+    print(colored(f"Data size: {size / 1073741824:.2f} GB", 'green'))
 
-def dir_size(path):
-    """Returns the size of `path` folder."""
-    files = list(path.glob('**/*'))
-    size = 0
-    for file in files:
-        if file.is_file():
-            size += file.stat().st_size
+    # Print the number of games and frames.
+    print(colored(f"{game_count} game(s), {frame_count} frame(s)", 'green'))
 
-    # Convert to GB.
-    size = size / 1073741824
-    
-    return "Data size: " + '{:.2f}'.format(size) + " GB"
+
+    # Print categories with minumum and maximum number of frames.
+    print_min_max()
 
 
 def print_min_max():
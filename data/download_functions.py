@@ -29,19 +29,42 @@ resizes them to required resolution and saves them.
 
 Functions:  
 1) Download stream segments, extract and save frames.  
-2) Helper function. Returns the last added frame number for a directory.  
-3) Deletes files in `temp` directory.
+2) Download segments in parallel, yield them in order.  
+3) Download a segment.  
+4) Decode the first frame of a segment in memory with ffmpeg.  
+5) Decode the first frame of a segment saved to a file with cv.  
+6) Helper function. Returns the last added frame number for a directory,
+used once per directory by the `FrameNumbers` allocator.  
+7) Checks that a segment is a video file.
 """
 
 import requests
-import re
+import shutil
+import subprocess
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
+from threading import Lock
 
 import cv2 as cv
-
-from data.log import log
-
-from config import IMG_SIZE, DOWNLOAD_PATH
+import numpy as np
+
+from data.log import log, DebugSegments
+from data.hls import parse_playlist, live_segments
+from data.api import create_session
+from data.dedup import HashIndex
+from data.shards import ShardWriter
+from data.metrics import counter, histogram
+from data.trace import span
+
+from config import (IMG_SIZE, DOWNLOAD_PATH,
+                    HARVEST_WORKERS, SEGMENT_WORKERS,
+                    DECODE_IN_MEMORY, FFMPEG_PATH, DECODE_TIMEOUT,
+                    DEDUP_DISTANCE, STORAGE_FORMAT,
+                    LOG_FILE, DEBUG_SEGMENTS_SIZE, DEBUG_SEGMENTS_RATE,
+                    HTTP_TIMEOUT)
 
 IMG_HEIGHT = IMG_SIZE["height"]
 IMG_WIDTH = IMG_SIZE["width"]
@@ -60,19 +83,119 @@ for path in paths:
     if not path.exists():
         path.mkdir()
 
+# Default session for playlist and segment requests.
+default_http_session = create_session()
+
+# Worker pool that prefetches segments for all harvester workers.
+segment_pool = ThreadPoolExecutor(
+    max_workers=HARVEST_WORKERS * SEGMENT_WORKERS
+)
+
+class FrameNumbers:
+    """
+    Thread-safe allocator of frame numbers.  
+
+    Scans a directory with `last_added_num` once, when the directory is
+    used for the first time, then hands out the following numbers from an
+    in-memory counter. Shared by all harvester workers of the process.  
+
+    `save` creates frame files exclusively, so harvesters in other
+    processes writing to the same directory never overwrite each other's
+    frames: the directory is rescanned when a number is taken.
+    """
 
-def download_frames(streamlink_session, login, game_id=None):
+    def __init__(self):
+        self.lock = Lock()
+        self.counters = dict()
+
+    def allocate(self, path):
+        """Returns the next free frame number for a `path` directory."""
+        with self.lock:
+            if path not in self.counters:
+                self.counters[path] = last_added_num(path)
+            self.counters[path] += 1
+
+            return self.counters[path]
+
+    def save(self, path, data):
+        """
+        Saves `data` to the next free `number.jpg` file in a `path`
+        directory. Returns the file path.
+        """
+        while True:
+            file_path = Path.joinpath(path, f"{self.allocate(path)}.jpg")
+            try:
+                with open(file_path, 'xb') as file:
+                    file.write(data)
+                return file_path
+
+            except FileExistsError:
+                # The number was taken by another process, rescan.
+                with self.lock:
+                    self.counters[path] = max(self.counters[path],
+                                              last_added_num(path))
+
+
+# Frame number allocator for `frames` and `recognition` folders.
+frame_numbers = FrameNumbers()
+
+# Size capped and rate limited buffer of segments that failed.
+debug_segments = DebugSegments(debug_path, DEBUG_SEGMENTS_SIZE,
+                               DEBUG_SEGMENTS_RATE)
+
+# Index of saved frame hashes, `None` if deduplication is disabled.
+hash_index = HashIndex(DEDUP_DISTANCE) if DEDUP_DISTANCE is not None else None
+
+# Shard writer, `None` if frames are saved as separate files.
+shard_writer = ShardWriter() if STORAGE_FORMAT == "shards" else None
+
+# Decode segments in memory only if ffmpeg is available.
+decode_in_memory_enabled = DECODE_IN_MEMORY and bool(shutil.which(FFMPEG_PATH))
+
+# Harvester metrics.
+segment_seconds = histogram('harvester_segment_seconds',
+                            "Segment download latency in seconds.")
+segment_bytes = counter('harvester_segment_bytes_total',
+                        "Downloaded segment bytes.")
+segment_failures = counter('harvester_segment_failures_total',
+                           "Segments that couldn't be downloaded.")
+decode_seconds = histogram('harvester_decode_seconds',
+                           "Segment decoding time in seconds.", ['method'])
+resize_seconds = histogram('harvester_resize_seconds',
+                           "Frame resizing time in seconds.")
+ad_segments = counter('harvester_ad_segments_total',
+                      "Ad segments skipped.")
+duplicate_frames = counter('harvester_duplicate_frames_total',
+                           "Near-duplicate frames skipped.")
+
+
+def download_frames(streamlink_session, login, game_id=None,
+                    http_session=None):
     """
     Downloads stream segments in best quality, gets frames from segments,
     resizes frames to required resolution and saves them.  
     
-    Saves in `framesPath`/`gameID` folder if `gameID` is passed,
+    Saves in `framesPath`/`gameID` folder (or appends to a `gameID` shard
+    if `STORAGE_FORMAT` is "shards") if `gameID` is passed,
     else saves in `recognitionTempPath`.  
     
-    Yields saved frame paths.  
+    Frames that are near-duplicates of frames saved in `gameID` category
+    are skipped.  
+
+    `http_session` is a pooled session for playlist and segment requests
+    shared by harvester workers, `default_http_session` is used if not
+    passed.  
+
+    Yields tuples (`path`, `size`) of saved frames, `size` is the size
+    of the encoded frame in bytes.  
     Returns `None` if can't get frames.
     """
-    if game_id:
+    http_session = http_session or default_http_session
+
+    if game_id and shard_writer:
+        download_path = None
+        temp_path = data_temp_path
+    elif game_id:
 
         # Create `gameID` folder if not exists.
         download_path = Path.joinpath(frames_path, str(game_id))
@@ -87,7 +210,9 @@ def download_frames(streamlink_session, login, game_id=None):
     # Get a dictionary of format {`quality`: `url`} containing 
     # `.m3u8` file urls for every quality.
     try:
-        m3u8_links = streamlink_session.streams(f"https://www.twitch.tv/{login}")
+        with span('streams', login=login):
+            m3u8_links = streamlink_session.streams(
+                f"https://www.twitch.tv/{login}")
     except:
         print(f"Streamlink couldn't get {login}'s stream.")
         return None
@@ -100,74 +225,226 @@ def download_frames(streamlink_session, login, game_id=None):
     # Get the best quality `.m3u8` url.
     m3u8 = m3u8_links["best"].url
     
-    # Request `.m3u8` file.
-    response = requests.get(m3u8).text
-
-    # Ensure that `.m3u8` file links to stream source and not to ads.
-    if response.lower().count("twitch-ad") > 1:
+    with span('playlist', login=login):
+        # Request `.m3u8` file.
+        try:
+            response = http_session.get(m3u8, timeout=HTTP_TIMEOUT).text
+        except requests.RequestException:
+            print(f"Couldn't get {login}'s playlist.")
+            return None
+
+        # Get segments that are not ads.
+        playlist = parse_playlist(response)
+        seg_links = [segment.url for segment in live_segments(playlist)]
+    if len(seg_links) < len(playlist):
+        ad_segments.inc(len(playlist) - len(seg_links))
+        print(f"Skipped {len(playlist) - len(seg_links)} ad segment(s).")
+    if not seg_links:
         print("Ad.")
         return None
 
-    # Get segment links.
-    seg_links = re.findall(r'(https?://\S+)', response)[2:-2]
-
     # Download and save all frames from segments.
-    frame_number = last_added_num(download_path) + 1
-    for link, seg_number in zip(seg_links, range(1, len(seg_links) + 1)):
-
-        # Request `.ts` file.
-        segment = requests.get(link).content
-
-        # Save the file.
-        seg_path = Path.joinpath(temp_path, f"segment{seg_number}.ts")
-        with open(seg_path, 'wb') as file:
-            file.write(segment)
-
-        # Open segment with cv.
-        video = cv.VideoCapture(str(seg_path))
+    skipped = 0
+    segments = fetch_segments(http_session, seg_links, login)
+    for segment, seg_number in zip(segments, range(1, len(seg_links) + 1)):
 
-        # Ensure it is a video file.
-        if not is_video(video):
-            video.release()
-            seg_path.unlink()
+        # Skip segments that couldn't be downloaded.
+        if segment is None:
             continue
 
         try:
-            # Get the first frame and release the video.
-            frame = video.read()[1]
-            video.release()
-
-            # Delete segment.
-            seg_path.unlink()
+            # Get the first frame. Decode the segment in memory and fall
+            # back to the file-based decoding if it fails.
+            frame = None
+            if decode_in_memory_enabled:
+                with decode_seconds.time(method='memory'), \
+                        span('decode', login=login, segment=seg_number,
+                             method='memory'):
+                    frame = decode_in_memory(segment)
+            if frame is None:
+                seg_path = Path.joinpath(temp_path,
+                                         f"{login}_segment{seg_number}.ts")
+                with decode_seconds.time(method='file'), \
+                        span('decode', login=login, segment=seg_number,
+                             method='file'):
+                    frame = decode_from_file(segment, seg_path)
+
+                # Ensure it is a video file.
+                if frame is None:
+                    continue
 
             # Resize and save the frame.
-            frame = cv.resize(frame,
-                              (IMG_WIDTH, IMG_HEIGHT),
-                              interpolation=cv.INTER_AREA)
-            frame_path = Path.joinpath(download_path, f"{frame_number}.jpg")
-            cv.imwrite(str(frame_path), frame)
-            frame_number += 1
-
-            if game_id:
-                # Yield path to save it in the database.
-                yield  str(Path.joinpath(Path(str(game_id)), frame_path.name))
-            else:
-                # Yield path for recognition.
-                yield str(frame_path)
+            if frame.shape[:2] != (IMG_HEIGHT, IMG_WIDTH):
+                with resize_seconds.time(), \
+                        span('resize', login=login, segment=seg_number):
+                    frame = cv.resize(frame,
+                                      (IMG_WIDTH, IMG_HEIGHT),
+                                      interpolation=cv.INTER_AREA)
+
+            # Skip near-duplicates of frames saved in the category.
+            frame_hash = None
+            if game_id and hash_index:
+                with span('dedup', login=login, segment=seg_number):
+                    frame_hash = hash_index.check(game_id, frame)
+                if frame_hash is None:
+                    duplicate_frames.inc()
+                    skipped += 1
+                    continue
+
+            with span('store', login=login, segment=seg_number):
+                data = cv.imencode('.jpg', frame)[1].tobytes()
+
+                if game_id and shard_writer:
+                    # Append the frame to a shard, get (shard, offset) path
+                    # to save it in the database.
+                    frame_path = shard_writer.write(game_id, data)
+                else:
+                    file_path = frame_numbers.save(download_path, data)
+
+                    # Get path to save it in the database or the full path
+                    # for recognition.
+                    frame_path = (str(Path.joinpath(Path(str(game_id)),
+                                                    file_path.name))
+                                  if game_id else str(file_path))
+
+            # Index the hash only after the frame is stored.
+            if frame_hash is not None:
+                hash_index.insert(game_id, frame_hash)
+
+            yield frame_path, len(data)
 
         except Exception as e:
             print("Unexpected Error.")
 
-            # Save segment in `debugPath`.
-            seg_number = last_added_num(debug_path) + 1
-            seg_path_debug = Path.joinpath(debug_path, f"{seg_number}.ts")
-            with open(seg_path_debug, 'wb') as file:
-                file.write(segment)
-            print(f"{seg_path_debug.name} saved.")
+            # Save the segment in `debug_path` if the limits allow.
+            debug_file = debug_segments.save(segment)
+            if debug_file:
+                print(f"{debug_file} saved.")
+
+            # Log the stream, the segment and the exception.
+            log("segment_error", e,
+                login=login,
+                game_id=game_id,
+                qualities=list(m3u8_links),
+                playlist_url=m3u8,
+                segment=seg_number,
+                segment_url=seg_links[seg_number - 1],
+                segment_count=len(seg_links),
+                segment_size=len(segment),
+                debug_segment=debug_file)
+            print(f"Exception saved in {LOG_FILE}.")
+
+    if skipped:
+        print(f"Skipped {skipped} duplicate frame(s) from '{login}'.")
+
+
+def fetch_segments(http_session, seg_links, login=None):
+    """
+    Downloads `.ts` files from `seg_links` in parallel with `segment_pool`.  
+
+    Yields segment contents in the order of `seg_links`, keeping at most
+    `SEGMENT_WORKERS` downloads in flight ahead of the consumer. `login`
+    is only used in trace spans.
+    """
+    links = iter(seg_links)
+    pending = deque(segment_pool.submit(fetch_segment,
+                                        http_session, link, login)
+                    for link in islice(links, SEGMENT_WORKERS))
+
+    while pending:
+        with span('segment_wait', login=login):
+            segment = pending.popleft().result()
+
+        # Start the next download before the segment is processed.
+        for link in islice(links, 1):
+            pending.append(segment_pool.submit(fetch_segment,
+                                               http_session, link, login))
+
+        yield segment
 
-            # Log data and excepiton.
-            log(login, game_id, m3u8_links, m3u8, response, seg_links, e)
-            print("Exception saved in data/log.txt.")
+
+def fetch_segment(http_session, link, login=None):
+    """
+    Downloads a `.ts` file and returns its content.  
+    Returns `None` if the request fails.
+    """
+    start = time.perf_counter()
+    try:
+        with span('segment', login=login):
+            response = http_session.get(link, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+
+        segment_seconds.observe(time.perf_counter() - start)
+        segment_bytes.inc(len(response.content))
+
+        return response.content
+
+    except requests.RequestException:
+        segment_failures.inc()
+        return None
+
+
+def decode_in_memory(segment):
+    """
+    Decodes the first frame of a segment by piping it to ffmpeg.  
+    ffmpeg also resizes the frame to `IMG_SIZE`, the segment never
+    touches the disk.  
+
+    Returns the frame as a numpy array of shape (height, width, 3) in
+    BGR order or `None` if can't decode.
+    """
+    command = [FFMPEG_PATH, '-loglevel', 'quiet',
+               '-i', 'pipe:0',
+               '-frames:v', '1',
+               '-vf', f'scale={IMG_WIDTH}:{IMG_HEIGHT}:flags=area',
+               '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+               'pipe:1']
+    try:
+        process = subprocess.run(command,
+                                 input=segment,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL,
+                                 timeout=DECODE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+    # Ensure a whole frame was decoded.
+    if len(process.stdout) != IMG_HEIGHT * IMG_WIDTH * 3:
+        return None
+
+    return np.frombuffer(process.stdout, dtype=np.uint8).\
+              reshape((IMG_HEIGHT, IMG_WIDTH, 3))
+
+
+def decode_from_file(segment, seg_path):
+    """
+    Saves a segment to `seg_path`, gets the first frame with cv
+    and deletes the file.  
+
+    Returns `None` if the segment is not a video file.
+    """
+    # Save the file.
+    with open(seg_path, 'wb') as file:
+        file.write(segment)
+
+    # Open segment with cv.
+    video = cv.VideoCapture(str(seg_path))
+
+    # Ensure it is a video file.
+    if not is_video(video):
+        video.release()
+        seg_path.unlink()
+        return None
+
+    # Get the first frame, release the video and delete the segment.
+    success, frame = video.read()
+    video.release()
+    seg_path.unlink()
+
+    if not success:
+        raise ValueError(f"Can't read a frame from {seg_path.name}.")
+
+    return frame
 
 
 def last_added_num(path):
@@ -177,12 +454,11 @@ def last_added_num(path):
 
     Return 0 if no files in directory.
     """
-    files = list(path.iterdir())
-    if not files:
+    # Get all frame numbers, skip temporary files.
+    numbers = [int(file.name.split('.')[0]) for file in path.iterdir()
+               if file.name.split('.')[0].isdigit()]
+    if not numbers:
         return 0
-    
-    # Get all frame numbers.
-    numbers = [int(str(file.name).split('.')[0]) for file in files]
 
     return max(numbers)
 
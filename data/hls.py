@@ -0,0 +1,190 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file parses HLS (`.m3u8`) media playlists and finds ad segments.  
+
+Twitch marks stitched ads with `EXT-X-DATERANGE` tags (`twitch-stitched-ad`
+class or a non-live `twitch-stream-source`) and with `EXTINF` titles other
+than "live". A segment is an ad if any of these marks apply to it.  
+
+Functions:  
+    1) Parse a playlist into a list of segments.  
+    2) Get segments that are not ads.  
+    3) Parse tag attributes.  
+    4) Parse a date.
+"""
+
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+# Playlist segment. `date` is the program date time of the segment start
+# or `None`, `discontinuity` is `True` if the segment follows a
+# discontinuity tag.
+Segment = namedtuple('Segment',
+                     ['url', 'duration', 'title', 'date',
+                      'discontinuity', 'ad'])
+
+# Date range. `end` is `None` for ranges that end on the next range.
+DateRange = namedtuple('DateRange', ['id', 'cls', 'start', 'end', 'source'])
+
+ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+AD_CLASS = "twitch-stitched-ad"
+SOURCE_CLASS = "twitch-stream-source"
+
+
+def parse_playlist(text):
+    """Parses a media playlist. Returns a list of segments."""
+    entries = []
+    date_ranges = []
+
+    duration = None
+    title = ""
+    date = None
+    discontinuity = False
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith("#EXTINF:"):
+            value, _, title = line[len("#EXTINF:"):].partition(',')
+            try:
+                duration = float(value)
+            except ValueError:
+                duration = None
+
+        elif line.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+            date = parse_date(line[len("#EXT-X-PROGRAM-DATE-TIME:"):])
+
+        elif line.startswith("#EXT-X-DISCONTINUITY-SEQUENCE:"):
+            # Playlist header, not a discontinuity.
+            continue
+
+        elif line == "#EXT-X-DISCONTINUITY":
+            discontinuity = True
+
+        elif line.startswith("#EXT-X-DATERANGE:"):
+            date_range = parse_date_range(line[len("#EXT-X-DATERANGE:"):])
+            if date_range:
+                date_ranges.append(date_range)
+
+        elif not line.startswith("#"):
+            # Segment url.
+            entries.append((line, duration, title, date, discontinuity))
+
+            # The next segment starts after this one.
+            if date and duration:
+                date += timedelta(seconds=duration)
+            duration = None
+            title = ""
+            discontinuity = False
+
+    return [Segment(*entry, is_ad(entry[2], entry[3], date_ranges))
+            for entry in entries]
+
+
+def live_segments(segments):
+    """Returns a list of segments that are not ads."""
+    return [segment for segment in segments if not segment.ad]
+
+
+def is_ad(title, date, date_ranges):
+    """
+    Returns `True` if a segment with `title` and `date` is an ad
+    according to its title or `date_ranges`.
+    """
+    # Ad segments have titles like "Amazon|123", stream segments - "live".
+    if title and title != "live":
+        return True
+
+    if not date:
+        return False
+
+    # Check stitched ad ranges.
+    for date_range in date_ranges:
+        if ((date_range.cls == AD_CLASS
+                or date_range.id.startswith("stitched-ad"))
+                and date_range.start <= date
+                and (date_range.end is None or date < date_range.end)):
+            return True
+
+    # Check the stream source of the last source range started before
+    # the segment.
+    sources = [date_range for date_range in date_ranges
+               if date_range.cls == SOURCE_CLASS and date_range.start <= date]
+    if sources:
+        source = max(sources, key=lambda date_range: date_range.start)
+        if source.source and source.source != "live":
+            return True
+
+    return False
+
+
+def parse_date_range(text):
+    """
+    Parses `EXT-X-DATERANGE` tag attributes.  
+    Returns `None` if the range has no valid start date.
+    """
+    attributes = parse_attributes(text)
+
+    start = parse_date(attributes.get("START-DATE", ""))
+    if not start:
+        return None
+
+    end = parse_date(attributes.get("END-DATE", ""))
+    if not end and "DURATION" in attributes:
+        try:
+            end = start + timedelta(seconds=float(attributes["DURATION"]))
+        except ValueError:
+            end = None
+
+    return DateRange(attributes.get("ID", ""),
+                     attributes.get("CLASS", ""),
+                     start, end,
+                     attributes.get("X-TV-TWITCH-STREAM-SOURCE"))
+
+
+def parse_attributes(text):
+    """Returns a dictionary of tag attributes with unquoted values."""
+    return {name: value.strip('"')
+            for name, value in ATTRIBUTE_RE.findall(text)}
+
+
+def parse_date(text):
+    """Parses an ISO 8601 date. Returns `None` if can't parse."""
+    text = text.strip().replace("Z", "+00:00")
+
+    # Remove the colon from the timezone for `%z` in python 3.6.
+    text = re.sub(r'([+-]\d\d):(\d\d)$', r'\1\2', text)
+
+    for date_format in ('%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z'):
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+
+    return None
@@ -22,38 +22,61 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-"""This file prints information about the database and a list of all games."""
+"""
+This file prints information about the database and a list of all games.  
+
+The data size is read from the database counters. `--rescan` walks the
+downloaded data, records frame sizes and fixes the counters.
+"""
 
-from pathlib import Path
-import requests
+import argparse
 
 from data.download import print_dataset_info
-from data.api import game_id_to_name
+from data.api import create_session, game_ids_to_names
+from data.db_functions import session_scope, rescan_sizes
+from data.shards import data_path
 
-from config import DOWNLOAD_PATH
 
-data_path = Path.joinpath(Path(DOWNLOAD_PATH), "frames")
+def info(rescan=False):
+    """Prints info and a list of games. Rescans the data if `rescan`."""
+    if rescan:
+        rescan_data()
 
-def info():
-    """Prints info and a list of games."""
     print_dataset_info()
     print_games()
 
 
+def rescan_data():
+    """Records sizes of downloaded frames, compares them with counters."""
+    with session_scope() as db_session:
+        disk_size, counted_size = rescan_sizes(db_session)
+
+    print(f"Frames on disk: {disk_size / 1073741824:.2f} GB, "
+          f"counted: {counted_size / 1073741824:.2f} GB.")
+    if disk_size != counted_size:
+        print(f"Fixed counters by {disk_size - counted_size} byte(s).")
+
+
 def print_games():
     """Prints all games from the dataset."""
     # Get game IDs.
     game_ids = list(p.name for p in data_path.glob('*'))
 
     # Get game names.
-    api_session = requests.session()
-    games = dict()
-    for game_id in game_ids:
-        games[game_id] = game_id_to_name(api_session, game_id)
-    
+    api_session = create_session()
+    names = game_ids_to_names(api_session, game_ids)
+    games = {game_id: names.get(game_id) for game_id in game_ids}
+
     # Print in alphabetical order.
-    for game_id in sorted(games, key=games.get):
+    for game_id in sorted(games, key=lambda game_id: str(games[game_id])):
         print(f"{games[game_id]}, game ID: {game_id}.")
 
 if __name__ == "__main__":
-    info()
+    parser = argparse.ArgumentParser(
+        description="Print the dataset info and a list of games.")
+    parser.add_argument('--rescan', action='store_true',
+                        help="walk the downloaded data to verify and fix "
+                             "the data size counters")
+    args = parser.parse_args()
+
+    info(args.rescan)
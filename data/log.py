@@ -22,22 +22,181 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-"""This file creates a log file and writes in it."""
+"""
+This file has a non-blocking structured logger and a bounded buffer of
+debug segments.  
+
+`log` puts a record to a queue and returns, a background thread writes
+records as JSON lines to `LOG_FILE`. Records are dropped (and counted)
+if the queue is full.  
+
+`DebugSegments` keeps segments that failed to be processed in a folder
+limited by size (the oldest segments are deleted) and by the number of
+segments saved per minute.
+"""
 
+import atexit
+import json
+import time
+import traceback
+from collections import deque
+from datetime import datetime
 from pathlib import Path
+from queue import Queue, Full
+from threading import Thread, Lock
+
+from config import LOG_FILE
+
+# Maximum number of records waiting to be written.
+QUEUE_SIZE = 10000
+
+# Stops the logger thread.
+STOP = object()
+
+
+class Logger:
+    """Logger that writes JSON lines to `path` from a background thread."""
+
+    def __init__(self, path, queue_size=QUEUE_SIZE):
+        self.path = Path(path)
+        self.queue = Queue(queue_size)
+        self.lock = Lock()
+        self.dropped = 0
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def log(self, event, exception=None, **fields):
+        """Queues a record, drops it if the queue is full."""
+        record = {'time': datetime.utcnow().isoformat(), 'event': event}
+        record.update(fields)
+        try:
+            self.queue.put_nowait((record, exception))
+        except Full:
+            with self.lock:
+                self.dropped += 1
+
+    def close(self, timeout=5):
+        """Writes queued records and stops the logger thread."""
+        self.queue.put(STOP)
+        self.thread.join(timeout)
+
+    def run(self):
+        """
+        Logger thread. Writes queued records, the file is created when
+        the first record arrives.
+        """
+        file = None
+        try:
+            while True:
+                item = self.queue.get()
+                if item is STOP:
+                    return
+
+                if file is None:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    file = self.path.open('a')
+
+                file.write(self.format(*item) + "\n")
+
+                # Report dropped records.
+                with self.lock:
+                    dropped, self.dropped = self.dropped, 0
+                if dropped:
+                    file.write(self.format({
+                        'time': datetime.utcnow().isoformat(),
+                        'event': "dropped",
+                        'records': dropped
+                    }) + "\n")
+
+                # Flush when the queue is drained.
+                if self.queue.empty():
+                    file.flush()
+
+        finally:
+            if file is not None:
+                file.close()
+
+    @staticmethod
+    def format(record, exception=None):
+        """Returns a record as a JSON line."""
+        if exception is not None:
+            record['error'] = repr(exception)
+            record['traceback'] = "".join(traceback.format_exception(
+                type(exception), exception, exception.__traceback__))
+
+        return json.dumps(record, default=str)
+
+
+class DebugSegments:
+    """
+    Thread-safe ring buffer of debug segments in a folder.  
+
+    Saves at most `rate` segments per minute and deletes the oldest
+    segments when the folder exceeds `max_size` bytes. Segments saved by
+    previous runs count towards the size.
+    """
+
+    def __init__(self, path, max_size, rate):
+        self.path = Path(path)
+        self.max_size = max_size
+        self.rate = rate
+        self.lock = Lock()
+        self.skipped = 0
+
+        # Times of segments saved during the last minute.
+        self.saved = deque()
+
+        # Saved segments (oldest first), their total size and the last
+        # segment number.
+        files = sorted((file for file in self.path.glob('*.ts')
+                        if file.stem.isdigit()),
+                       key=lambda file: int(file.stem))
+        self.files = deque((file, file.stat().st_size) for file in files)
+        self.size = sum(size for _, size in self.files)
+        self.number = int(files[-1].stem) if files else 0
+
+    def save(self, segment):
+        """
+        Saves a `segment`. Returns the file name or `None` if the segment
+        was skipped by the rate or size limit.
+        """
+        with self.lock:
+            now = time.monotonic()
+            while self.saved and now - self.saved[0] >= 60:
+                self.saved.popleft()
+
+            if len(self.saved) >= self.rate or len(segment) > self.max_size:
+                self.skipped += 1
+                return None
+            self.saved.append(now)
+
+            # Delete the oldest segments to fit the new one.
+            while self.files and self.size + len(segment) > self.max_size:
+                file, size = self.files.popleft()
+                try:
+                    file.unlink()
+                except FileNotFoundError:
+                    pass
+                self.size -= size
+
+            self.number += 1
+            file = Path.joinpath(self.path, f"{self.number}.ts")
+            file.write_bytes(segment)
+            self.files.append((file, len(segment)))
+            self.size += len(segment)
+
+            return file.name
 
-path = Path.joinpath(Path("data"), "log.txt")
 
+# Logger of the process.
+logger = Logger(LOG_FILE)
+atexit.register(logger.close)
 
-def log(*args):
-    """Writes `text` to a log file."""
-    # Create file if not exists.
-    if not path.exists():
-        print("Created data/log.txt file.")
-        path.touch()
 
-    # Write in file.
-    with path.open("a") as f:
-        for arg in args:
-            f.write(f"{arg}\n")
-    f.write("\n")
+def log(event, exception=None, **fields):
+    """
+    Logs an `event` with `fields` and an `exception` (message and
+    traceback) without blocking.
+    """
+    logger.log(event, exception, **fields)
@@ -0,0 +1,202 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file exports `frames` and `games` tables to a columnar frames
+manifest used by `model.create` instead of walking the data folders.  
+
+Columns: `path`, `game_id`, `login`, `date` and `size` (frame size in
+bytes). The format is chosen by the file suffix: ".parquet" or ".arrow"
+(Arrow IPC file, memory-mapped on read). Needs `pyarrow`.  
+
+Functions:  
+    1) Export the manifest.  
+    2) Read the manifest.  
+    3) Get sizes of frames on disk.
+
+Usage: python -m data.manifest [--output path]
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from data.shards import data_path, shard_frame_sizes
+
+from config import DOWNLOAD_PATH, STORAGE_FORMAT, MANIFEST_FILE, SYNC_BATCH
+
+MANIFEST_PATH = Path.joinpath(Path(DOWNLOAD_PATH), MANIFEST_FILE)
+
+if pa:
+    SCHEMA = pa.schema([
+        ('path', pa.string()),
+        ('game_id', pa.int32()),
+        ('login', pa.string()),
+        ('date', pa.timestamp('us')),
+        ('size', pa.int64()),
+    ])
+
+
+def export_manifest(path=MANIFEST_PATH, batch_size=SYNC_BATCH):
+    """
+    Exports frames of games in the database to a manifest at `path`.  
+
+    Frames are read and written in batches of `batch_size` rows. Sizes
+    recorded in the database are used, sizes of older frames are read
+    from disk and frames missing on disk are skipped.
+    Returns tuple (`exported`, `skipped`).
+    """
+    if not pa:
+        raise ImportError("Exporting the manifest needs pyarrow.")
+
+    # Import here, reading the manifest doesn't need the database.
+    from data.db import Game, Frame
+    from data.db_functions import session_scope
+
+    # Write to a temporary file, replace the manifest when done.
+    path = Path(path)
+    temp_path = path.with_name(path.name + ".tmp")
+    if path.suffix == ".parquet":
+        writer = pq.ParquetWriter(str(temp_path), SCHEMA)
+    else:
+        writer = pa.ipc.new_file(str(temp_path), SCHEMA)
+
+    sizes = FrameSizes()
+    exported = skipped = 0
+    with session_scope() as session, writer:
+        query = session.query(Frame.path, Frame.game_id,
+                              Frame.user_login, Frame.date, Frame.size).\
+                        join(Game, Game.id == Frame.game_id).\
+                        order_by(Frame.game_id, Frame.id).\
+                        execution_options(stream_results=True).\
+                        yield_per(batch_size)
+
+        columns = {name: [] for name in SCHEMA.names}
+        for frame_path, game_id, login, date, size in query:
+            if size is None:
+                size = sizes.get(frame_path)
+            if size is None:
+                skipped += 1
+                continue
+
+            columns['path'].append(frame_path)
+            columns['game_id'].append(game_id)
+            columns['login'].append(login)
+            columns['date'].append(date)
+            columns['size'].append(size)
+
+            if len(columns['path']) >= batch_size:
+                exported += write_batch(writer, columns)
+
+        exported += write_batch(writer, columns)
+
+    os.replace(temp_path, path)
+
+    return exported, skipped
+
+
+def write_batch(writer, columns):
+    """Writes and clears `columns` lists. Returns the number of rows."""
+    rows = len(columns['path'])
+    if rows:
+        writer.write_table(pa.table(columns, schema=SCHEMA))
+        for values in columns.values():
+            values.clear()
+
+    return rows
+
+
+def read_manifest(path=MANIFEST_PATH):
+    """
+    Returns the manifest at `path` as a `pyarrow.Table` or `None` if it
+    doesn't exist or `pyarrow` is not installed.
+    """
+    path = Path(path)
+    if not pa or not path.exists():
+        return None
+
+    if path.suffix == ".parquet":
+        return pq.read_table(str(path))
+
+    return pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+
+
+class FrameSizes:
+    """
+    Sizes of frames on disk. Shard indexes are read once per shard and
+    kept for the current category, frame files are checked with `os.stat`.
+    """
+
+    def __init__(self, data_path=data_path):
+        self.data_path = data_path
+        self.shards = dict()
+
+    def get(self, path):
+        """Returns the size of a frame in bytes or `None` if it's missing."""
+        if STORAGE_FORMAT == "shards":
+            shard = path.rsplit('@', 1)[0]
+            if shard not in self.shards:
+                # Frames are exported by category, forget other categories.
+                category = shard.split('/', 1)[0]
+                if any(not key.startswith(category + '/')
+                       for key in self.shards):
+                    self.shards.clear()
+
+                shard_path = Path.joinpath(self.data_path, shard)
+                self.shards[shard] = (shard_frame_sizes(shard_path)
+                                      if shard_path.exists() else {})
+
+            return self.shards[shard].get(path)
+
+        try:
+            return os.stat(Path.joinpath(self.data_path, path)).st_size
+        except OSError:
+            return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the frames manifest for training.")
+    parser.add_argument('--output', default=str(MANIFEST_PATH),
+                        help="manifest path (.parquet or .arrow)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    exported, skipped = export_manifest(args.output)
+    print(f"Exported {exported} frame(s) to {args.output} "
+          f"in {time.perf_counter() - start:.1f} s.")
+    if skipped:
+        print(f"Skipped {skipped} frame(s) missing on disk, "
+              "synchronize the database with `python -m data.db_sync`.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file has an in-process metrics registry exposed over HTTP in the
+Prometheus text format.  
+
+Metrics are created once at module level with `counter`, `histogram` or
+`gauge` and updated by harvester threads. `start_server` serves
+`/metrics` from a background thread.  
+
+Classes and functions:  
+    1) Counter.  
+    2) Histogram.  
+    3) Gauge read from a function when scraped.  
+    4) Registry that renders metrics in the text format.  
+    5) Create and register metrics.  
+    6) Start the metrics HTTP server.
+"""
+
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+# Default histogram buckets in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    """Base class of a metric with named labels."""
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = Lock()
+        self.values = dict()
+
+    def key(self, labels):
+        """Returns a tuple of label values in `self.labels` order."""
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, "
+                             f"got {tuple(labels)}.")
+
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def label_text(self, key, extra=()):
+        """Returns `{label="value",...}` text for a key."""
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+
+        return "{" + ",".join(f'{label}="{escape(value)}"'
+                              for label, value in pairs) + "}"
+
+    def render(self):
+        """Returns lines of the metric in the text format."""
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            lines.extend(self.samples())
+
+        return lines
+
+
+class Counter(Metric):
+    """Counter that only goes up."""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Increases the counter by `amount`."""
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        return [f"{self.name}{self.label_text(key)} {value}"
+                for key, value in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    """Histogram of observed values in cumulative `buckets`."""
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """Adds an observed `value`."""
+        key = self.key(labels)
+        with self.lock:
+            # [bucket counts..., +Inf count, sum]
+            counts = self.values.setdefault(
+                key, [0] * (len(self.buckets) + 1) + [0]
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the time spent in the `with` block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        lines = []
+        for key, counts in sorted(self.values.items()):
+            bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, counts):
+                lines.append(f"{self.name}_bucket"
+                             f"{self.label_text(key, [('le', bound)])} "
+                             f"{count}")
+            lines.append(f"{self.name}_sum{self.label_text(key)} {counts[-1]}")
+            lines.append(f"{self.name}_count{self.label_text(key)} "
+                         f"{counts[-2]}")
+
+        return lines
+
+
+class Gauge(Metric):
+    """Gauge whose value is returned by `function` when scraped."""
+    type = 'gauge'
+
+    def __init__(self, name, help, function):
+        super().__init__(name, help)
+        self.function = function
+
+    def samples(self):
+        return [f"{self.name} {self.function()}"]
+
+
+class Registry:
+    """Thread-safe collection of metrics."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.metrics = dict()
+
+    def register(self, metric):
+        """Adds a `metric`, returns the registered metric of that name."""
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        """Returns all metrics in the Prometheus text format."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of the process.
+registry = Registry()
+
+
+def counter(name, help, labels=()):
+    """Creates and registers a counter."""
+    return registry.register(Counter(name, help, labels))
+
+
+def histogram(name, help, labels=(), buckets=BUCKETS):
+    """Creates and registers a histogram."""
+    return registry.register(Histogram(name, help, labels, buckets))
+
+
+def gauge(name, help, function):
+    """Creates and registers a gauge, replaces a gauge of the same name."""
+    metric = Gauge(name, help, function)
+    with registry.lock:
+        registry.metrics[name] = metric
+
+    return metric
+
+
+def escape(value):
+    """Escapes a label value."""
+    return (value.replace("\\", "\\\\")
+                 .replace("\n", "\\n")
+                 .replace('"', '\\"'))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves `registry` metrics at `/metrics`."""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', "text/plain; version=0.0.4")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Doesn't log requests."""
+
+
+def start_server(port, host="localhost"):
+    """
+    Serves metrics at `http://host:port/metrics` from a daemon thread.
+    Returns the server.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
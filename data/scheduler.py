@@ -0,0 +1,147 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file has a scheduler that chooses categories for harvester workers.  
+
+Keeps frame counts of categories in a min-heap in memory, so choosing the
+category with the minimum number of frames doesn't contact the database.
+"""
+
+import heapq
+import time
+from threading import Lock
+
+from data.db import Game
+
+from config import SCHEDULER_SYNC
+
+
+class CategoryScheduler:
+    """
+    Thread-safe in-memory priority queue of categories by frame count.  
+
+    Loads frame counts from `games` table with `load`, is updated with
+    `add_frames` as frames are written and should be reloaded every
+    `sync_seconds` seconds (`needs_sync`). A claimed category is not
+    returned to other workers until it is released.
+    """
+
+    def __init__(self, sync_seconds=SCHEDULER_SYNC):
+        self.sync_seconds = sync_seconds
+        self.lock = Lock()
+
+        # {game_id: frame count}
+        self.counts = dict()
+
+        # Heap of (frame count, game_id). Entries with a count different
+        # from `counts` are outdated and skipped.
+        self.heap = []
+
+        self.claimed = set()
+        self.synced = time.monotonic()
+
+    def load(self, session):
+        """Loads frame counts of all games from the database."""
+        counts = {id: frames or 0 for id, frames in
+                  session.query(Game.id, Game.frames)}
+
+        with self.lock:
+            self.counts = counts
+            self.rebuild()
+            self.synced = time.monotonic()
+
+    def needs_sync(self):
+        """
+        Returns `True` once every `sync_seconds` seconds, so only one
+        worker reloads the counts.
+        """
+        with self.lock:
+            if time.monotonic() - self.synced < self.sync_seconds:
+                return False
+
+            self.synced = time.monotonic()
+            return True
+
+    def game_ids(self):
+        """Returns a set of scheduled game IDs."""
+        with self.lock:
+            return set(self.counts)
+
+    def claim(self):
+        """
+        Claims the category with the minimum number of frames that is not
+        claimed by other workers. Returns its game ID or `None`.
+        """
+        with self.lock:
+            skipped = []
+            game_id = None
+            while self.heap:
+                entry = heapq.heappop(self.heap)
+                frames, id = entry
+
+                # Skip outdated entries.
+                if self.counts.get(id) != frames:
+                    continue
+
+                skipped.append(entry)
+                if id not in self.claimed:
+                    game_id = id
+                    break
+
+            # Return current entries to the heap.
+            for entry in skipped:
+                heapq.heappush(self.heap, entry)
+
+            if game_id is not None:
+                self.claimed.add(game_id)
+
+            return game_id
+
+    def release(self, game_id):
+        """Releases a claimed category."""
+        with self.lock:
+            self.claimed.discard(game_id)
+
+    def add_frames(self, game_id, count=1):
+        """Adds `count` frames to a category."""
+        with self.lock:
+            if game_id not in self.counts:
+                return
+
+            self.counts[game_id] += count
+            heapq.heappush(self.heap, (self.counts[game_id], game_id))
+
+            # Remove outdated entries if the heap is too big.
+            if len(self.heap) > 4 * len(self.counts) + 64:
+                self.rebuild()
+
+    def rebuild(self):
+        """Rebuilds the heap. Must be called with `lock` acquired."""
+        self.heap = [(frames, id) for id, frames in self.counts.items()]
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.counts)
@@ -0,0 +1,207 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file stores frames in append-only shards.  
+
+Every category folder in `shards` has numbered `.tar` shards of about
+`SHARD_SIZE` bytes and `.idx` offset index files with
+`name offset size` lines. A frame path is `game_id/shard.tar@offset`,
+where `offset` is the position of the frame data in the shard.  
+
+Functions and classes:  
+    1) Shard writer.  
+    2) Iterate over the frames of a shard sequentially.  
+    3) Get frame paths of a shard from its index.  
+    4) Get frame sizes of a shard from its index.  
+    5) Get shard paths of a category.
+"""
+
+import tarfile
+import time
+from pathlib import Path
+from threading import Lock
+
+from config import DOWNLOAD_PATH, SHARD_SIZE, STORAGE_FORMAT
+
+shards_path = Path.joinpath(Path(DOWNLOAD_PATH), "shards")
+
+# Folder with category folders of the `STORAGE_FORMAT` storage.
+data_path = (shards_path if STORAGE_FORMAT == "shards"
+             else Path.joinpath(Path(DOWNLOAD_PATH), "frames"))
+
+
+class ShardWriter:
+    """
+    Thread-safe writer that appends frames to the current shard of
+    every category and starts a new shard when it exceeds `shard_size`.  
+
+    Shards are never reopened, every writer starts new shards. Shard
+    files are created exclusively, a number taken by a writer in another
+    process is skipped.
+    """
+
+    def __init__(self, path=shards_path, shard_size=SHARD_SIZE):
+        self.path = path
+        self.shard_size = shard_size
+        self.lock = Lock()
+
+        # {game_id: [shard number, shard file, index file, frame count]}
+        self.shards = dict()
+
+        if not self.path.exists():
+            self.path.mkdir()
+
+    def write(self, game_id, data):
+        """
+        Appends `data` (encoded image) to `game_id` category shard.  
+
+        Returns the frame path.
+        """
+        with self.lock:
+            shard = self.current_shard(game_id)
+            number, file, index, count = shard
+
+            # Write the tar header.
+            info = tarfile.TarInfo(f"{count + 1}.jpg")
+            info.size = len(data)
+            info.mtime = int(time.time())
+            file.write(info.tobuf(tarfile.USTAR_FORMAT))
+
+            # Write the data padded to the tar block size.
+            offset = file.tell()
+            file.write(data)
+            remainder = len(data) % tarfile.BLOCKSIZE
+            if remainder:
+                file.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            file.flush()
+
+            # Update the index.
+            index.write(f"{info.name}\t{offset}\t{info.size}\n")
+            index.flush()
+            shard[3] += 1
+
+            return f"{game_id}/{number}.tar@{offset}"
+
+    def current_shard(self, game_id):
+        """Returns `game_id` category shard, opens a new one if needed."""
+        shard = self.shards.get(game_id)
+        if shard and shard[1].tell() < self.shard_size:
+            return shard
+
+        if shard:
+            self.close_shard(shard)
+            number = shard[0] + 1
+        else:
+            # Create `gameID` folder if not exists.
+            category_path = Path.joinpath(self.path, str(game_id))
+            if not category_path.exists():
+                category_path.mkdir()
+
+            number = max((int(p.stem) for p in category_shards(category_path)),
+                         default=0) + 1
+
+        # Skip shard numbers taken by writers in other processes.
+        while True:
+            shard_path = Path.joinpath(self.path, str(game_id),
+                                       f"{number}.tar")
+            try:
+                file = shard_path.open('xb')
+            except FileExistsError:
+                number += 1
+                continue
+
+            try:
+                index = shard_path.with_suffix('.idx').open('x')
+                break
+            except FileExistsError:
+                file.close()
+                shard_path.unlink()
+                number += 1
+
+        shard = [number, file, index, 0]
+        self.shards[game_id] = shard
+
+        return shard
+
+    def close_shard(self, shard):
+        """Writes the end-of-archive marker and closes the shard files."""
+        file, index = shard[1], shard[2]
+        file.write(tarfile.NUL * (tarfile.BLOCKSIZE * 2))
+        file.close()
+        index.close()
+
+    def close(self):
+        """Closes all shards."""
+        with self.lock:
+            for shard in self.shards.values():
+                self.close_shard(shard)
+            self.shards.clear()
+
+
+def iter_shard(shard_path):
+    """
+    Reads a shard sequentially.  
+
+    Yields tuples (`path`, `data`) for every frame. Stops at the first
+    incomplete frame of an unfinished shard.
+    """
+    prefix = f"{shard_path.parent.name}/{shard_path.name}"
+    try:
+        with tarfile.open(shard_path, 'r|') as tar:
+            for info in tar:
+                data = tar.extractfile(info).read()
+                yield f"{prefix}@{info.offset_data}", data
+
+    except tarfile.ReadError:
+        return
+
+
+def shard_frames(shard_path):
+    """Returns a list of frame paths of a shard read from its index."""
+    prefix = f"{shard_path.parent.name}/{shard_path.name}"
+    index_path = shard_path.with_suffix('.idx')
+    if not index_path.exists():
+        return [path for path, _ in iter_shard(shard_path)]
+
+    with index_path.open() as index:
+        return [f"{prefix}@{line.split()[1]}"
+                for line in index if line.strip()]
+
+
+def shard_frame_sizes(shard_path):
+    """Returns a dictionary {`path`: `size`} of a shard read from its index."""
+    prefix = f"{shard_path.parent.name}/{shard_path.name}"
+    index_path = shard_path.with_suffix('.idx')
+    if not index_path.exists():
+        return {path: len(data) for path, data in iter_shard(shard_path)}
+
+    with index_path.open() as index:
+        rows = map(str.split, filter(str.strip, index))
+        return {f"{prefix}@{offset}": int(size) for _, offset, size in rows}
+
+
+def category_shards(category_path):
+    """Returns a sorted list of shard paths in a category folder."""
+    return sorted(category_path.glob('*.tar'), key=lambda p: int(p.stem))
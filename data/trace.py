@@ -0,0 +1,172 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file has opt-in tracing of download stages.  
+
+`span` times a block of code and writes a JSON line with the stage name,
+start time, duration and fields (stream login, segment number) to
+`TRACE_FILE`. Spans are no-ops if `TRACE_FILE` is "".  
+
+Stages of `download_frames`:  
+    streams - get stream playlists with streamlink.  
+    playlist - download and parse the media playlist.  
+    segment - download a segment (in a segment pool thread).  
+    segment_wait - wait for the next segment download.  
+    decode - decode the first frame of a segment.  
+    resize - resize the frame.  
+    dedup - check the frame for near-duplicates.  
+    store - encode and save the frame.
+
+Usage: python -m data.trace [trace file] [--by field]  
+Prints the number of spans, total, mean, p50, p95 and max time and the
+share of the total traced time for every stage (and field value with
+`--by`). Segment downloads run in parallel with other stages, compare
+them with `segment_wait`.
+"""
+
+import argparse
+import atexit
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from threading import Lock, current_thread
+
+from config import DOWNLOAD_PATH, TRACE_FILE
+
+TRACE_PATH = Path.joinpath(Path(DOWNLOAD_PATH), TRACE_FILE or "trace.jsonl")
+
+# Returned by `span` when tracing is disabled.
+NO_SPAN = nullcontext()
+
+
+class Tracer:
+    """Thread-safe writer of spans to a JSON lines file."""
+
+    def __init__(self, path):
+        self.lock = Lock()
+        self.file = open(path, 'a', buffering=1024 * 1024)
+
+    def write(self, stage, start, duration, fields):
+        """Writes a span."""
+        line = json.dumps(dict(fields, stage=stage, start=start,
+                               duration=duration,
+                               thread=current_thread().name))
+        with self.lock:
+            self.file.write(line + "\n")
+
+    def close(self):
+        """Writes buffered spans and closes the file."""
+        with self.lock:
+            self.file.close()
+
+
+# Tracer, `None` if tracing is disabled.
+tracer = Tracer(TRACE_PATH) if TRACE_FILE else None
+if tracer:
+    atexit.register(tracer.close)
+
+
+def span(stage, **fields):
+    """
+    Returns a context manager that writes the time spent in the `with`
+    block as a `stage` span with `fields`.
+    """
+    if tracer is None:
+        return NO_SPAN
+
+    return timed_span(stage, fields)
+
+
+@contextmanager
+def timed_span(stage, fields):
+    """Times a span and writes it with `tracer`."""
+    start = time.time()
+    perf_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.write(stage, start, time.perf_counter() - perf_start, fields)
+
+
+def read_spans(path):
+    """Yields spans from a trace file, skips incomplete lines."""
+    with open(path) as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def report(path, by=None):
+    """Prints a per-stage breakdown of spans in a trace file."""
+    durations = defaultdict(list)
+    for record in read_spans(path):
+        key = record['stage']
+        if by:
+            key = f"{key} {by}={record.get(by)}"
+        durations[key].append(record['duration'])
+
+    if not durations:
+        print(f"No spans in {path}.")
+        return
+
+    total = sum(sum(values) for values in durations.values())
+    print(f"{'stage':<30} {'count':>8} {'total s':>10} {'mean ms':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'share':>6}")
+    for key, values in sorted(durations.items(),
+                              key=lambda item: -sum(item[1])):
+        values.sort()
+        count = len(values)
+        print(f"{key:<30} {count:>8} {sum(values):>10.2f} "
+              f"{sum(values) / count * 1000:>9.1f} "
+              f"{values[count // 2] * 1000:>9.1f} "
+              f"{values[min(count - 1, int(count * 0.95))] * 1000:>9.1f} "
+              f"{values[-1] * 1000:>9.1f} "
+              f"{sum(values) / total:>6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Print a per-stage breakdown of a trace file.")
+    parser.add_argument('path', nargs='?', default=str(TRACE_PATH),
+                        help="trace file")
+    parser.add_argument('--by',
+                        help="also group spans by a field, e.g. login")
+    args = parser.parse_args()
+
+    # Ensure the trace file exists.
+    if not Path(args.path).is_file():
+        print(f"No trace file at {args.path}. Set `TRACE_FILE` in config.py "
+              "to record spans while harvesting.")
+        return
+
+    report(args.path, args.by)
+
+
+if __name__ == "__main__":
+    main()
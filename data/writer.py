@@ -0,0 +1,246 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+This file has a database writer that adds frames to the database in a
+background thread.  
+
+Harvester workers only put frames to a bounded queue, so a slow commit
+doesn't stall downloading until the queue is full. Failed writes are
+retried, frames wait in the queue meanwhile.
+"""
+
+import time
+from collections import deque
+from datetime import datetime
+from queue import Queue, Empty, Full
+from threading import Thread, Event, Lock
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from data.db import Game
+from data.db_functions import FrameWriter, session_scope
+from data.metrics import counter, gauge
+
+from config import (FLUSH_FRAMES, FLUSH_SECONDS, WRITE_QUEUE_SIZE,
+                    WRITE_RETRY_DELAY, WRITE_RETRY_MAX)
+
+# Stops the writer thread.
+STOP = object()
+
+# Time workers waited for a full queue.
+queue_wait_seconds = counter('db_write_queue_wait_seconds_total',
+                             "Time workers waited for the full write queue.")
+
+
+class AsyncFrameWriter(FrameWriter):
+    """
+    `FrameWriter` that writes frames in a background thread.  
+
+    `add` puts a frame to a queue of `queue_size` frames and blocks only
+    when the queue is full (backpressure). The writer thread buffers
+    frames and writes them in batches like `FrameWriter`. `flush` waits
+    until queued frames are written, `close` flushes and stops the thread.
+    Queue depth, commit latency and the time workers waited for the
+    queue are reported by `info`.  
+
+    A failed batch is kept and retried with exponential backoff, new
+    frames are not taken from the queue until it's written. Frames of
+    games deleted from the database (by `db_sync`) are dropped from the
+    batch. Failed batches are dropped only while closing.
+    """
+
+    def __init__(self, max_frames=FLUSH_FRAMES, max_seconds=FLUSH_SECONDS,
+                 queue_size=WRITE_QUEUE_SIZE):
+        super().__init__(max_frames, max_seconds)
+        self.queue = Queue(queue_size)
+
+        # Delay before retrying a failed batch (0 - no failed batch),
+        # `flush` events waiting for the batch and the close request.
+        self.retry_delay = 0
+        self.waiters = []
+        self.closing = Event()
+
+        # Statistics.
+        self.stats_lock = Lock()
+        self.latencies = deque(maxlen=1000)
+        self.commits = 0
+        self.failed = 0
+        self.waited = 0
+
+        gauge('db_write_queue_depth', "Frames waiting to be written.",
+              self.queue.qsize)
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, path, game_id, login, size=None):
+        """Puts frame information to the queue, waits if it's full."""
+        frame = {'path': path,
+                 'game_id': game_id,
+                 'user_login': login,
+                 'date': datetime.utcnow(),
+                 'size': size}
+        try:
+            self.queue.put_nowait(frame)
+        except Full:
+            start = time.monotonic()
+            self.queue.put(frame)
+            waited = time.monotonic() - start
+            queue_wait_seconds.inc(waited)
+            with self.stats_lock:
+                self.waited += waited
+
+    def flush(self):
+        """Waits until frames queued before the call are written."""
+        done = Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        """
+        Writes queued frames and stops the writer thread. Frames that
+        can't be written are dropped.
+        """
+        self.closing.set()
+        self.queue.put(STOP)
+        self.thread.join()
+
+    def run(self):
+        """Writer thread. Buffers queued frames and writes them."""
+        while True:
+            # Retry a failed batch. New frames wait in the queue, so
+            # workers wait when it's full.
+            if self.retry_delay:
+                self.closing.wait(self.retry_delay)
+                with self.lock:
+                    self.write()
+                continue
+
+            # Wake up when the buffer has to be written by time.
+            timeout = self.flushed + self.max_seconds - time.monotonic()
+            try:
+                item = self.queue.get(timeout=max(timeout, 0))
+            except Empty:
+                item = None
+
+            with self.lock:
+                if item is STOP:
+                    self.write()
+                    return
+
+                if isinstance(item, Event):
+                    self.waiters.append(item)
+                    self.write()
+                    continue
+
+                if item is not None:
+                    self.buffer(item)
+
+                elapsed = time.monotonic() - self.flushed
+                if (len(self.rows) >= self.max_frames
+                        or elapsed >= self.max_seconds):
+                    self.write()
+
+    def write(self):
+        """
+        Writes buffered frames, records commit latency. Keeps frames of a
+        failed batch for a retry.
+        """
+        rows = self.rows
+        start = time.perf_counter()
+        try:
+            super().write()
+        except Exception as e:
+            print(f"Failed to write {len(rows)} frame(s) to the database: {e}")
+            self.keep(rows)
+            return
+
+        self.retry_delay = 0
+        self.notify()
+
+        if rows:
+            with self.stats_lock:
+                self.latencies.append(time.perf_counter() - start)
+                self.commits += 1
+
+    def keep(self, rows):
+        """
+        Buffers rows of a failed batch again for a retry, drops rows of
+        games that are not in the database. Drops every row if closing.
+        """
+        game_ids = {row['game_id'] for row in rows}
+        try:
+            with session_scope() as session:
+                query = session.query(Game.id).filter(Game.id.in_(game_ids))
+                existing = {id for id, in query}
+        except SQLAlchemyError:
+            # The database is unavailable, keep every row.
+            existing = game_ids
+
+        if self.closing.is_set():
+            existing = set()
+
+        kept = [row for row in rows if row['game_id'] in existing]
+        dropped = len(rows) - len(kept)
+        if dropped:
+            reason = ("on close" if self.closing.is_set()
+                      else "of deleted games")
+            print(f"Dropped {dropped} frame(s) {reason}.")
+            with self.stats_lock:
+                self.failed += dropped
+
+        for row in kept:
+            self.buffer(row)
+
+        if kept:
+            self.retry_delay = min(max(self.retry_delay * 2,
+                                       WRITE_RETRY_DELAY),
+                                   WRITE_RETRY_MAX)
+        else:
+            self.retry_delay = 0
+            self.notify()
+
+    def notify(self):
+        """Wakes up `flush` calls waiting for buffered frames."""
+        for waiter in self.waiters:
+            waiter.set()
+        self.waiters = []
+
+    def info(self):
+        """Returns queue depth, commit latency and waiting statistics."""
+        with self.stats_lock:
+            latencies = sorted(self.latencies)
+            commits, failed, waited = self.commits, self.failed, self.waited
+
+        p50 = latencies[len(latencies) // 2] if latencies else 0
+        p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+        info = (f"Write queue: {self.queue.qsize()}/{self.queue.maxsize} "
+                f"frame(s), {commits} commit(s), commit latency "
+                f"p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms. "
+                f"Workers waited for the queue {waited:.1f} s.")
+        if failed:
+            info += f" Dropped {failed} frame(s)."
+
+        return info
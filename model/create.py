@@ -24,6 +24,7 @@ SOFTWARE.
 
 """This file creates the model (model.h5) and class (classes.txt) files."""
 
+import zlib
 from pathlib import Path
 import matplotlib.pyplot as plt
 
@@ -31,13 +32,15 @@ import tensorflow as tf
 from tensorflow.keras import layers
 from tensorflow.keras.models import Sequential
 
-from config import (DOWNLOAD_PATH, MODEL_PATH, IMG_SIZE,
+from data.manifest import read_manifest
+from data.shards import data_path, category_shards, iter_shard
+
+from config import (MODEL_PATH, IMG_SIZE,
                     EPOCHS, DROPOUT, VALIDATION_SPLIT,
                     BATCH_SIZE, SHUFFLE_BUFFER, PREFETCH_BUFFER,
-                    VISUALIZE_RESULTS)
+                    VISUALIZE_RESULTS, STORAGE_FORMAT)
 
 
-DATA_PATH = Path.joinpath(Path(DOWNLOAD_PATH), "frames")
 MODEL_PATH = Path(MODEL_PATH)
 MODEL_FILE = Path.joinpath(MODEL_PATH, "model.h5")
 CLASS_FILE = Path.joinpath(MODEL_PATH, "classes.txt")
@@ -45,8 +48,15 @@ CLASS_FILE = Path.joinpath(MODEL_PATH, "classes.txt")
 IMG_HEIGHT = IMG_SIZE["height"]
 IMG_WIDTH = IMG_SIZE["width"]
 
-# Get all classes.
-CLASS_NAMES = [category.name for category in DATA_PATH.iterdir()]
+# Read the frames manifest (`python -m data.manifest`) if it's exported.
+MANIFEST = read_manifest()
+
+# Get all classes (sorted like `image_dataset_from_directory` labels).
+if MANIFEST is not None:
+    CLASS_NAMES = sorted(str(game_id) for game_id
+                         in MANIFEST.column('game_id').unique().to_pylist())
+else:
+    CLASS_NAMES = sorted(category.name for category in data_path.iterdir())
 NUM_CLASSES = len(CLASS_NAMES)
 
 # Save classes in a txt file.
@@ -69,7 +79,13 @@ session = tf.compat.v1.Session(config=config)
 def create():
     """Creates a model."""
     # Load the data.
-    train_ds, val_ds = load_data(str(DATA_PATH))
+    if STORAGE_FORMAT == "shards":
+        train_ds, val_ds = load_shards(data_path)
+    elif MANIFEST is not None:
+        print(f"Loading {MANIFEST.num_rows} frame(s) from the manifest.")
+        train_ds, val_ds = load_manifest(MANIFEST, data_path)
+    else:
+        train_ds, val_ds = load_data(str(data_path))
 
     # Create and compile the model.
     model = get_model()
@@ -117,6 +133,104 @@ def load_data(data_dir):
     return train_ds, val_ds
 
 
+def load_manifest(manifest, data_dir):
+    """
+    Loads the data from frame files listed in the `manifest`.
+    Returns tuple (`train_ds`, `val_ds`).  
+
+    Frames are split by a hash of their path like shards, so no folders
+    are walked.
+    """
+    # Split frame paths and labels into subsets.
+    labels = {name: label for label, name in enumerate(CLASS_NAMES)}
+    subsets = {False: ([], []), True: ([], [])}
+    for path, game_id in zip(manifest.column('path').to_pylist(),
+                             manifest.column('game_id').to_pylist()):
+        subset_paths, subset_labels = subsets[is_validation(path)]
+        subset_paths.append(f"{data_dir}/{path}")
+        subset_labels.append(labels[str(game_id)])
+
+    def decode_image(path, label):
+        """Reads, decodes and resizes an image."""
+        image = tf.io.decode_jpeg(tf.io.read_file(path), channels=3)
+        image = tf.image.resize(image, (IMG_HEIGHT, IMG_WIDTH))
+
+        return image, label
+
+    def subset(validation):
+        """Returns a batched dataset of a subset with shuffled paths."""
+        subset_paths, subset_labels = subsets[validation]
+        ds = tf.data.Dataset.from_tensor_slices((subset_paths, subset_labels))
+        ds = ds.shuffle(max(len(subset_paths), 1), seed=123)
+
+        return ds.map(decode_image,
+                      num_parallel_calls=tf.data.experimental.AUTOTUNE).\
+                  batch(BATCH_SIZE)
+
+    # Configure the dataset for performance.
+    train_ds = subset(False).prefetch(buffer_size=PREFETCH_BUFFER)
+    val_ds = subset(True).prefetch(buffer_size=PREFETCH_BUFFER)
+
+    return train_ds, val_ds
+
+
+def load_shards(data_dir):
+    """
+    Loads the data from shards. Returns tuple (`train_ds`, `val_ds`).  
+
+    Every shard is read sequentially, shards of different categories are
+    interleaved. Frames are split by a hash of their path.
+    """
+    # Get all shards and their labels.
+    shard_paths = []
+    labels = []
+    for label, name in enumerate(CLASS_NAMES):
+        for shard in category_shards(Path.joinpath(data_dir, name)):
+            shard_paths.append(str(shard))
+            labels.append(label)
+
+    def read_shard(shard_path, label, validation):
+        """Yields (`data`, `label`) for frames of a shard in a subset."""
+        for path, data in iter_shard(Path(shard_path.decode())):
+            if is_validation(path) == validation:
+                yield data, label
+
+    def decode_image(data, label):
+        """Decodes and resizes an image."""
+        image = tf.io.decode_jpeg(data, channels=3)
+        image = tf.image.resize(image, (IMG_HEIGHT, IMG_WIDTH))
+
+        return image, label
+
+    def subset(validation):
+        """Returns a batched dataset of a subset."""
+        ds = tf.data.Dataset.from_tensor_slices((shard_paths, labels))
+        ds = ds.shuffle(len(shard_paths), seed=123)
+        ds = ds.interleave(
+            lambda shard_path, label: tf.data.Dataset.from_generator(
+                read_shard,
+                output_signature=(tf.TensorSpec(shape=(), dtype=tf.string),
+                                  tf.TensorSpec(shape=(), dtype=tf.int32)),
+                args=(shard_path, label, validation)
+            ),
+            cycle_length=NUM_CLASSES
+        )
+
+        return ds.map(decode_image).batch(BATCH_SIZE)
+
+    # Configure the dataset for performance.
+    train_ds = subset(False).shuffle(SHUFFLE_BUFFER).\
+                             prefetch(buffer_size=PREFETCH_BUFFER)
+    val_ds = subset(True).prefetch(buffer_size=PREFETCH_BUFFER)
+
+    return train_ds, val_ds
+
+
+def is_validation(path):
+    """Returns `True` if a frame `path` belongs to the validation subset."""
+    return zlib.crc32(path.encode()) % 1000 < VALIDATION_SPLIT * 1000
+
+
 def get_model():
     """Creates and compiles neural network."""
     model = Sequential([
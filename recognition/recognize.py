@@ -30,14 +30,13 @@ and predicts the game.
 import sys
 import numpy as np
 from pathlib import Path
-import requests
 
 import tensorflow as tf
 from tensorflow import keras
 from streamlink import Streamlink
 
 from data.download_functions import download_frames
-from data.api import game_id_to_name
+from data.api import create_session, game_ids_to_names
 
 from config import DOWNLOAD_PATH, MODEL_PATH, IMG_SIZE
 
@@ -70,17 +69,22 @@ def recognize(login):
     """Recognizes livestream category."""
     # Create streamlink and api sessions.
     streamlink_session = Streamlink()
-    api_session = requests.session()
+    api_session = create_session()
     
     # Load the model.
     model = keras.models.load_model(str(MODEL_FILE))
 
+    # Get names of all classes.
+    game_names = game_ids_to_names(api_session, CLASS_NAMES)
+
     # Recognize frames.
-    frames = list(download_frames(streamlink_session, login))
+    frames = [frame_path for frame_path, _
+              in download_frames(streamlink_session, login,
+                                 http_session=api_session)]
     if not frames:
         print("Couldn't download stream frames.")
         return None
-    scores = [recognize_frame(api_session, model, frame) for frame in frames]
+    scores = [recognize_frame(game_names, model, frame) for frame in frames]
 
     # Delete downloaded frames.
     del_temp_files()
@@ -96,15 +100,19 @@ def recognize(login):
     game_id = CLASS_NAMES[index]
 
     # Get game name from game ID.
-    game = game_id_to_name(api_session, game_id)
+    game = game_names.get(str(game_id))
 
     print("{} with a score of {:.1f}".format(game, score))
 
     return game, score
 
 
-def recognize_frame(api_session, model, img_path):
-    """Recognizes image class."""
+def recognize_frame(game_names, model, img_path):
+    """
+    Recognizes image class.  
+
+    `game_names` is a dictionary of format {game_id: game_name}.
+    """
     # Load and resize the image.
     img = keras.preprocessing.image.load_img(
         img_path, target_size=(IMG_HEIGHT, IMG_WIDTH)
@@ -124,7 +132,7 @@ def recognize_frame(api_session, model, img_path):
     print(
         "Frame {}: {} with a {:.2f}% confidence."
         .format(Path(img_path).name.split(".")[0],
-                game_id_to_name(api_session, CLASS_NAMES[np.argmax(score)]),
+                game_names.get(str(CLASS_NAMES[np.argmax(score)])),
                 100 * np.max(score))
     )
 
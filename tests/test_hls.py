@@ -0,0 +1,98 @@
+"""
+MIT License
+
+Copyright (c) 2021 molokhovdmitry
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Tests of HLS playlist parsing and ad detection."""
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from data.hls import (parse_playlist, live_segments, is_ad,
+                      parse_date_range, parse_date)
+
+FIXTURES = Path.joinpath(Path(__file__).parent, "fixtures")
+
+
+def read_fixture(name):
+    return Path.joinpath(FIXTURES, name).read_text()
+
+
+def test_stitched_ad_playlist():
+    segments = parse_playlist(read_fixture("stitched_ad.m3u8"))
+
+    assert [segment.url.rsplit('/', 1)[1] for segment in segments] == \
+        ["100.ts", "101.ts", "0.ts", "1.ts", "102.ts"]
+    assert [segment.ad for segment in segments] == \
+        [False, False, True, True, False]
+    assert [segment.discontinuity for segment in segments] == \
+        [False, False, True, False, True]
+    assert [segment.duration for segment in segments] == [2.0] * 5
+
+    assert [segment.url for segment in live_segments(segments)] == \
+        [segments[0].url, segments[1].url, segments[4].url]
+
+
+def test_discontinuity_sequence_is_not_a_discontinuity():
+    segments = parse_playlist("#EXTM3U\n"
+                              "#EXT-X-DISCONTINUITY-SEQUENCE:0\n"
+                              "#EXTINF:2.000,live\n"
+                              "0.ts\n")
+
+    assert len(segments) == 1
+    assert not segments[0].discontinuity
+    assert not segments[0].ad
+
+
+def test_date_range_with_duration():
+    date_range = parse_date_range(
+        'ID="stitched-ad-1",CLASS="twitch-stitched-ad",'
+        'START-DATE="2021-05-01T12:00:04.000Z",DURATION=4.000')
+
+    assert date_range.id == "stitched-ad-1"
+    assert date_range.cls == "twitch-stitched-ad"
+    assert date_range.end - date_range.start == timedelta(seconds=4)
+
+    # A range without a valid start date is skipped.
+    assert parse_date_range('ID="ad",DURATION=4.000') is None
+
+
+def test_is_ad():
+    start = datetime(2021, 5, 1, 12, tzinfo=timezone.utc)
+    ranges = [parse_date_range(
+        'ID="stitched-ad-1",CLASS="twitch-stitched-ad",'
+        'START-DATE="2021-05-01T12:00:00Z",DURATION=4')]
+
+    assert is_ad("Amazon|1", None, [])
+    assert not is_ad("live", None, ranges)
+    assert is_ad("live", start + timedelta(seconds=2), ranges)
+    assert not is_ad("live", start + timedelta(seconds=4), ranges)
+
+
+def test_parse_date():
+    expected = datetime(2021, 5, 1, 12, 0, 4, 500000, tzinfo=timezone.utc)
+
+    assert parse_date("2021-05-01T12:00:04.500Z") == expected
+    assert parse_date("2021-05-01T12:00:04.500+00:00") == expected
+    assert parse_date("2021-05-01T12:00:04Z") == \
+        expected.replace(microsecond=0)
+    assert parse_date("not a date") is None